@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from repository import Repository
+
+log = logging.getLogger(__name__)
+
+
+class AuditLog:
+    # Events for the LOG_CHANNEL_ID channel. Each one is written to the
+    # audit_log table first, so handlers never wait on Discord and nothing is
+    # lost if it is slow or down. A background task then posts them in batches:
+    # one embed per BATCH_SIZE events or per FLUSH_INTERVAL seconds, whichever
+    # comes first, retrying with backoff when rate limited. Events that could
+    # not be posted stay undelivered in the table and are sent on next start.
+    # Any other error is logged and the dispatcher backs off and carries on,
+    # so one bad batch or database hiccup doesn't stop the log for the run.
+
+    BATCH_SIZE = 10
+    FLUSH_INTERVAL = 5.0
+    MAX_QUEUED = 500
+    MAX_RETRIES = 5
+    MAX_BACKOFF = 60.0
+    EMBED_LIMIT = 4000  # Discord allows 4096 characters in a description
+
+    def __init__(self, db: Repository, client: discord.Client, channel_id: int):
+        self.db = db
+        self.client = client
+        self.channel_id = channel_id
+        self._queue = asyncio.Queue(maxsize=self.MAX_QUEUED)
+        self._task = None
+        self._first_id = None
+        self._lock = asyncio.Lock()
+        self.stats = dict.fromkeys(("logged", "batches", "sent", "overflow", "retries", "failed"), 0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def log(self, kind: str, message: str, actor_id: int | None = None,
+                  target_id: int | None = None, amount: int | None = None):
+        async with self._lock:
+            event_id = await self.db.add_audit_event(kind, message, str(actor_id) if actor_id else None,
+                                                     str(target_id) if target_id else None, amount)
+            if self._first_id is None:
+                self._first_id = event_id
+
+        self.stats["logged"] += 1
+        try:
+            self._queue.put_nowait((event_id, message))
+        except asyncio.QueueFull:
+            # Still in the table; it goes out with the replay on next start
+            self.stats["overflow"] += 1
+
+    async def _run(self):
+        # The channel cache is empty until the gateway is ready
+        await self.client.wait_until_ready()
+        try:
+            await self._replay()
+        except Exception:
+            log.exception("Replaying undelivered audit events failed; they are retried on next start")
+
+        delay = 1.0
+        while True:
+            try:
+                batch = [await self._queue.get()]
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+
+                while len(batch) < self.BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._send(batch)
+                delay = 1.0
+            except Exception:
+                # The batch stays undelivered in the table for the next start
+                self.stats["failed"] += 1
+                log.exception("Posting audit events failed, retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_BACKOFF)
+
+    async def _replay(self):
+        # Only events from before this run; newer ones are already queued
+        async with self._lock:
+            before_id = self._first_id or await self.db.next_audit_id()
+        while True:
+            backlog = await self.db.get_undelivered_audit(before_id, self.BATCH_SIZE)
+            if not backlog or not await self._send(backlog):
+                return
+            if len(backlog) < self.BATCH_SIZE:
+                return
+
+    async def _send(self, batch: list[tuple]) -> bool:
+        channel = self.client.get_channel(self.channel_id)
+        if channel is None:
+            self.stats["failed"] += 1
+            return False
+
+        lines = []
+        length = 0
+        for _, message in batch:
+            if length + len(message) + 1 > self.EMBED_LIMIT:
+                break
+            lines.append(message)
+            length += len(message) + 1
+        if not lines:
+            lines = [batch[0][1][:self.EMBED_LIMIT]]
+        sent = batch[:len(lines)]
+
+        embed = discord.Embed(description="\n".join(lines), color=discord.Color.dark_grey())
+        delay = 1.0
+
+        for _ in range(self.MAX_RETRIES):
+            try:
+                await channel.send(embed=embed)
+                break
+            except discord.RateLimited as e:
+                delay = max(delay, e.retry_after)
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    self.stats["failed"] += 1
+                    print(f"[Audit] Failed to post {len(sent)} events: {e}")
+                    return False
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+            delay *= 2
+        else:
+            self.stats["failed"] += 1
+            print(f"[Audit] Gave up posting {len(sent)} events, they stay queued in the database")
+            return False
+
+        self.stats["batches"] += 1
+        self.stats["sent"] += len(sent)
+        await self.db.mark_audit_delivered([event_id for event_id, _ in sent])
+
+        # Events that did not fit in this embed go out in the next one
+        if len(sent) < len(batch):
+            return await self._send(batch[len(sent):])
+        return True
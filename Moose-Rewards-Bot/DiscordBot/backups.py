@@ -0,0 +1,198 @@
+# Online snapshots of the SQLite databases, and restoring them.
+#
+# The bot backs itself up every BACKUP_INTERVAL_HOURS (see main.py). By hand,
+# from the DiscordBot folder:
+#
+#   python -m backups list
+#   python -m backups backup --db points.db
+#   python -m backups restore backups/points-20250131-120000.db.gz --db points.db
+#
+# Restore only with the bot stopped; the file it replaces is snapshotted first.
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 28  # Snapshots kept per database, a week at the default 6 hours
+STEP_PAGES = 256  # Pages per backup step, 1 MB at SQLite's default page size
+STEP_SLEEP = 0.005  # Seconds between steps
+MAX_RESTARTS = 5
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+def snapshot_name(path: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{datetime.now():%Y%m%d-%H%M%S}.db.gz"
+
+
+def snapshots(directory: str, path: str) -> list[str]:
+    # Snapshots of the database at path, oldest first
+    stem = re.escape(os.path.splitext(os.path.basename(path))[0])
+    pattern = re.compile(rf"{stem}-\d{{8}}-\d{{6}}\.db\.gz")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if pattern.fullmatch(name))
+
+
+def copy_database(source: sqlite3.Connection, target: sqlite3.Connection) -> dict:
+    # Copies STEP_PAGES pages at a time, pausing between steps. A write from
+    # another connection normally makes SQLite start the copy over, so in WAL
+    # mode (every database the bot opens) the copy reads from one snapshot
+    # held for its whole length: the bot keeps writing to the WAL meanwhile
+    # and the snapshot is consistent. Otherwise, if restarts keep happening
+    # the copy is made in a single step instead.
+    progress = {"steps": 0, "restarts": 0, "pages": 0, "remaining": None}
+
+    def step(status, remaining, total):
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > MAX_RESTARTS:
+                raise BackupRestarted
+        progress["steps"] += 1
+        progress["pages"] = total
+        progress["remaining"] = remaining
+
+    wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    if wal:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    try:
+        source.backup(target, pages=STEP_PAGES, progress=step, sleep=STEP_SLEEP)
+        one_step = False
+    except BackupRestarted:
+        source.backup(target, pages=-1)
+        progress["steps"] += 1
+        progress["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+        one_step = True
+    finally:
+        if wal:
+            source.execute("COMMIT")
+
+    return {"pages": progress["pages"], "steps": progress["steps"], "restarts": progress["restarts"],
+            "one_step": one_step}
+
+
+def snapshot(path: str, directory: str = BACKUP_DIR, keep: int | None = BACKUP_KEEP) -> dict:
+    # Copies the live database at path into a gzipped snapshot in directory,
+    # checks the copy and deletes all but the newest keep snapshots of it
+    os.makedirs(directory, exist_ok=True)
+    destination = os.path.join(directory, snapshot_name(path))
+    copy_path = destination.removesuffix(".gz") + ".tmp"
+    started = time.perf_counter()
+
+    source = sqlite3.connect(path, isolation_level=None)
+    target = sqlite3.connect(copy_path, isolation_level=None)
+    try:
+        copied = copy_database(source, target)
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        source.close()
+        target.close()
+
+    try:
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"Snapshot of {path} failed its integrity check: {check}")
+        copy_seconds = time.perf_counter() - started
+        with open(copy_path, "rb") as raw, gzip.open(destination + ".tmp", "wb", compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed, 1024 * 1024)
+        os.replace(destination + ".tmp", destination)
+        size = os.path.getsize(copy_path)
+    finally:
+        os.remove(copy_path)
+
+    removed = snapshots(directory, path)[:-keep] if keep else []
+    for old in removed:
+        os.remove(old)
+
+    seconds = time.perf_counter() - started
+    return {
+        "file": destination,
+        **copied,
+        "seconds": round(seconds, 3),
+        "copy_seconds": round(copy_seconds, 3),
+        "pages_per_second": round(copied["pages"] / copy_seconds) if copy_seconds else copied["pages"],
+        "bytes": size,
+        "compressed_bytes": os.path.getsize(destination),
+        "pruned": len(removed),
+        "finished_at": datetime.now(),
+    }
+
+
+def restore(snapshot_path: str, path: str, directory: str = BACKUP_DIR) -> dict:
+    # Replaces the database at path with a snapshot. The current database is
+    # snapshotted into directory first so a wrong restore can be undone.
+    started = time.perf_counter()
+    unpacked = path + ".restore"
+    with gzip.open(snapshot_path, "rb") as packed, open(unpacked, "wb") as raw:
+        shutil.copyfileobj(packed, raw, 1024 * 1024)
+
+    try:
+        source = sqlite3.connect(unpacked, isolation_level=None)
+        try:
+            check = source.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"{snapshot_path} failed its integrity check: {check}")
+
+            previous = snapshot(path, directory, keep=None)["file"] if os.path.exists(path) else None
+            # Copied through SQLite rather than over the file, so a leftover
+            # -wal file can't be replayed on top of the restored pages
+            target = sqlite3.connect(path, isolation_level=None)
+            try:
+                source.backup(target)
+                pages = target.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        os.remove(unpacked)
+
+    return {"pages": pages, "previous": previous, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def describe(result: dict) -> str:
+    return (f"{os.path.basename(result['file'])}: {result['pages']} pages in {result['copy_seconds']}s "
+            f"({result['pages_per_second']} pages/s, {result['steps']} steps, {result['restarts']} restarts"
+            f"{', copied in one step' if result['one_step'] else ''}), "
+            f"{result['bytes'] // 1024} KB -> {result['compressed_bytes'] // 1024} KB, {result['seconds']}s total")
+
+
+def main():
+    from storage import DB_PATH
+
+    parser = argparse.ArgumentParser(prog="python -m backups")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="where snapshots are kept")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="list snapshots of a database")
+    listing.add_argument("--db", default=DB_PATH)
+    backup = commands.add_parser("backup", help="take a snapshot now; safe while the bot runs")
+    backup.add_argument("--db", default=DB_PATH)
+    backup.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    restoring = commands.add_parser("restore", help="replace a database with a snapshot; stop the bot first")
+    restoring.add_argument("snapshot")
+    restoring.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for path in snapshots(args.dir, args.db):
+            print(f"{path}  {os.path.getsize(path) // 1024} KB")
+    elif args.command == "backup":
+        print(describe(snapshot(args.db, args.dir, args.keep)))
+    else:
+        result = restore(args.snapshot, args.db, args.dir)
+        print(f"Restored {args.db} from {args.snapshot}: {result['pages']} pages in {result['seconds']}s")
+        if result["previous"]:
+            print(f"The replaced database was saved as {result['previous']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import asyncio
+import functools
+
+import discord
+from discord.ui import View, Button
+
+from jobs import CommandQueue, report_failure
+from repository import Repository
+
+# Discord allows 25 components and 25 embed fields per message. Buy buttons
+# fill the first four rows and the fifth holds the page controls.
+PAGE_SIZE = 20
+# An embed's title, fields, footer and description may total 6000 characters.
+# Pages are cut short before their fields reach EMBED_LIMIT less what the
+# title, footer and balance line take, and any one field is clipped to fit.
+EMBED_LIMIT = 6000
+EMBED_RESERVED = 100
+FIELD_NAME_LIMIT = 256
+FIELD_VALUE_LIMIT = 1024
+
+
+def field(name: str, cost: int, description: str) -> tuple[str, str]:
+    return f"{name} - {cost} pts"[:FIELD_NAME_LIMIT], description[:FIELD_VALUE_LIMIT]
+
+
+def paginate(items: list[tuple]) -> list[list[tuple]]:
+    # Splits the catalog into pages of at most PAGE_SIZE items whose fields
+    # fit in one embed
+    chunks, chunk, size = [], [], 0
+    for item in items:
+        name, value = field(*item[1:])
+        length = len(name) + len(value)
+        if chunk and (len(chunk) == PAGE_SIZE or size + length > EMBED_LIMIT - EMBED_RESERVED):
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(item)
+        size += length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class BuyButton(Button):
+    def __init__(self, catalog: "StoreCatalog", item_id: int, name: str):
+        super().__init__(label=f"Buy {name}"[:80], style=discord.ButtonStyle.primary,
+                         custom_id=f"store:{catalog.guild_id}:buy:{item_id}")
+        self.catalog = catalog
+        self.item_id = item_id
+
+    async def callback(self, interaction: discord.Interaction):
+        await self.catalog.buy(interaction, self.item_id)
+
+
+class PageButton(Button):
+    def __init__(self, catalog: "StoreCatalog", label: str, page: int, target: int, disabled: bool):
+        super().__init__(label=label, style=discord.ButtonStyle.secondary, row=4, disabled=disabled,
+                         custom_id=f"store:{catalog.guild_id}:page:{page}:{target}")
+        self.catalog = catalog
+        self.target = target
+
+    async def callback(self, interaction: discord.Interaction):
+        await self.catalog.show_page(interaction, self.target)
+
+
+class StoreView(View):
+    def __init__(self, catalog: "StoreCatalog", items: list[tuple], page: int, page_count: int):
+        super().__init__(timeout=None)
+        for item_id, name, _, _ in items:
+            self.add_item(BuyButton(catalog, item_id, name))
+
+        if page_count > 1:
+            self.add_item(PageButton(catalog, "◀ Prev", page, page - 1, disabled=page == 0))
+            self.add_item(PageButton(catalog, "Next ▶", page, page + 1, disabled=page == page_count - 1))
+
+    async def on_error(self, interaction: discord.Interaction, error: Exception, item):
+        await super().on_error(interaction, error, item)
+        await report_failure(interaction)
+
+
+class StoreCatalog:
+    # Pre-rendered store pages, rebuilt only when /additem or /removeitem
+    # invalidates them. Each page keeps two views with the same custom_ids:
+    # one registered with client.add_view that handles every click, and a
+    # stopped copy that is only ever sent. discord.py gives views sent in
+    # ephemeral messages a 15 minute timeout, which would shut down the
+    # registered one if we sent it directly. Item IDs are per guild database,
+    # so the custom_ids carry the guild ID to keep guilds' buttons apart.
+    # A rebuild stops the registered views first, so buttons on old messages
+    # for items or pages that no longer exist stop dispatching.
+
+    def __init__(self, db: Repository, client: discord.Client, guild_id: int, jobs: CommandQueue):
+        self.db = db
+        self.client = client
+        self.guild_id = guild_id
+        self.jobs = jobs
+        self._pages = []
+        self._registered = []
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    async def pages(self) -> list[tuple]:
+        async with self._lock:
+            if self._stale:
+                await self._rebuild()
+        return self._pages
+
+    async def _rebuild(self):
+        items = await self.db.get_store_items()
+        chunks = paginate(items)
+        pages = []
+
+        # Stopped before the new views are added: stopping removes a view's
+        # custom_ids from the client, and the new pages reuse some of them
+        for view in self._registered:
+            view.stop()
+        self._registered = []
+
+        for page, chunk in enumerate(chunks):
+            embed = discord.Embed(title="🛒 Point Store", color=discord.Color.green())
+            for _, name, cost, description in chunk:
+                name, value = field(name, cost, description)
+                embed.add_field(name=name, value=value, inline=False)
+            if len(chunks) > 1:
+                embed.set_footer(text=f"Page {page + 1}/{len(chunks)}")
+
+            registered = StoreView(self, chunk, page, len(chunks))
+            self.client.add_view(registered)
+            self._registered.append(registered)
+            display = StoreView(self, chunk, page, len(chunks))
+            display.stop()
+            pages.append((embed, display))
+
+        self._pages = pages
+        self._stale = False
+
+    async def render(self, user_points: int, page: int = 0) -> tuple[discord.Embed, View] | None:
+        pages = await self.pages()
+        if not pages:
+            return None
+
+        embed, view = pages[max(0, min(page, len(pages) - 1))]
+        embed = embed.copy()
+        embed.description = f"You have **{user_points}** points"
+        return embed, view
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        user_points = await self.db.total_points(str(interaction.user.id))
+        rendered = await self.render(user_points, page)
+
+        if rendered is None:
+            await interaction.response.edit_message(content="The store is currently empty.", embed=None, view=None)
+            return
+
+        embed, view = rendered
+        await interaction.response.edit_message(embed=embed, view=view)
+
+    async def buy(self, interaction: discord.Interaction, item_id: int):
+        # Purchases are writes, so they go through the command queue like /give
+        await self.jobs.run(interaction, "buy", functools.partial(self._buy, interaction, item_id), thinking=False)
+
+    async def _buy(self, interaction: discord.Interaction, item_id: int):
+        status, item = await self.db.purchase(str(interaction.user.id), item_id)
+
+        if status == "no_item":
+            await interaction.followup.send("That item is no longer in the store.", ephemeral=True)
+            return
+        if status == "insufficient":
+            await interaction.followup.send("You don't have enough points!", ephemeral=True)
+            return
+
+        name, cost = item
+        await interaction.followup.send(f"You bought **{name}** for {cost} points!", ephemeral=True)
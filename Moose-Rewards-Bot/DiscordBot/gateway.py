@@ -0,0 +1,92 @@
+from collections import OrderedDict
+
+import discord
+
+MEMBER_CACHE_SIZE = 1000
+
+
+def client_options(low_memory: bool) -> dict:
+    # Intents and cache settings for the client. The default asks for
+    # everything the bot ever used and chunks every guild's member list at
+    # startup, so memory and time to ready grow with member count. Low-memory
+    # mode keeps only the events the bot handles, skips chunking and keeps no
+    # members or messages in discord.py's cache; MemberCache below then holds
+    # the members who actually interact with the bot.
+    if not low_memory:
+        intents = discord.Intents.default()
+        intents.reactions = True
+        intents.guilds = True
+        intents.message_content = True
+        intents.members = True
+        return {"intents": intents}
+
+    # Members stays on: it is what lets the bot fetch and chunk on demand
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_reactions = True
+    intents.members = True
+    return {
+        "intents": intents,
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "max_messages": None,
+    }
+
+
+class MemberCache:
+    # A small LRU of the members the bot has recently seen in interactions
+    # and reactions, for looking up members discord.py hasn't cached. Misses
+    # fall back to one REST fetch, whose result is kept here too.
+
+    def __init__(self, size: int = MEMBER_CACHE_SIZE):
+        self.size = size
+        self._members = OrderedDict()
+        self.stats = dict.fromkeys(("hits", "fetched", "not_found", "chunked"), 0)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def remember(self, member: discord.Member | discord.User | None):
+        if not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self._members[key] = member
+        self._members.move_to_end(key)
+        if len(self._members) > self.size:
+            self._members.popitem(last=False)
+
+    def get(self, guild_id: int, member_id: int) -> discord.Member | None:
+        member = self._members.get((guild_id, member_id))
+        if member is not None:
+            self._members.move_to_end((guild_id, member_id))
+        return member
+
+    async def resolve(self, guild: discord.Guild, member_id: int) -> discord.Member | None:
+        # None if they have left the guild
+        member = guild.get_member(member_id) or self.get(guild.id, member_id)
+        if member is not None:
+            self.stats["hits"] += 1
+            return member
+
+        try:
+            member = await guild.fetch_member(member_id)
+        except discord.NotFound:
+            self.stats["not_found"] += 1
+            return None
+        self.stats["fetched"] += 1
+        self.remember(member)
+        return member
+
+    async def role_members(self, role: discord.Role) -> list[discord.Member]:
+        # role.members only sees cached members. When the guild wasn't
+        # chunked, its member list is requested over the gateway once for
+        # this call and dropped afterwards instead of being kept.
+        guild = role.guild
+        if guild.chunked:
+            return role.members
+
+        self.stats["chunked"] += 1
+        members = await guild.chunk(cache=False)
+        if role.is_default():
+            return members
+        return [member for member in members if member.get_role(role.id)]
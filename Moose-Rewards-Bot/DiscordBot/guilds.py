@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+import discord
+
+from audit import AuditLog
+from catalog import StoreCatalog
+from jobs import CommandQueue
+from metrics import Metrics
+from repository import Repository, open_repository
+from tickets import TicketQueue, TicketRegistry
+
+GUILD_READ_WORKERS = 2  # Per guild; a busy process may hold dozens of guilds
+
+# Per-guild settings, written by /setup
+LOG_CHANNEL_KEY = "log_channel_id"
+TICKET_CATEGORY_KEY = "ticket_category_id"
+TICKET_PROMPT_CHANNEL_KEY = "ticket_prompt_channel_id"
+
+
+class GuildServices:
+    # Everything that belongs to one server: its database, store pages,
+    # ticket registry and queue, and audit log. Each guild has its own SQLite
+    # file and so its own writer thread, so one server's busy ledger never
+    # queues behind another's writes.
+
+    def __init__(self, guild_id: int, db: Repository, client: discord.Client, jobs: CommandQueue,
+                 owns_db: bool = True):
+        self.guild_id = guild_id
+        self.db = db
+        self.owns_db = owns_db
+        self.catalog = StoreCatalog(db, client, guild_id, jobs)
+        self.tickets = TicketRegistry(db)
+        self.ticket_queue = TicketQueue(self.tickets, 0)
+        self.audit = AuditLog(db, client, 0)
+
+    async def start(self):
+        await self.db.init()
+        self.configure()
+        # Registers the persistent store views so old store messages keep working
+        await self.catalog.pages()
+        self.ticket_queue.start()
+        self.audit.start()
+
+    async def stop(self):
+        await self.ticket_queue.stop()
+        await self.audit.stop()
+        if self.owns_db:
+            await self.db.close()
+
+    def setting_id(self, key: str) -> int | None:
+        value = self.db.get_setting(key)
+        return int(value) if value else None
+
+    def configure(self):
+        # Re-read the channel settings; call after /setup changes them
+        self.audit.channel_id = self.setting_id(LOG_CHANNEL_KEY) or 0
+        self.ticket_queue.category_id = self.setting_id(TICKET_CATEGORY_KEY) or 0
+
+
+class GuildRouter:
+    # Opens each guild's services the first time the guild is seen and keeps
+    # them for the life of the process. The home guild (GUILD_ID, the only
+    # guild before multi-guild support) keeps using the original database;
+    # every other guild gets data_dir/guild-<id>.db, or its own guild_<id>
+    # schema when database_url points at PostgreSQL.
+
+    def __init__(self, client: discord.Client, metrics: Metrics, jobs: CommandQueue, data_dir: str,
+                 home_guild_id: int | None = None, home_db: Repository | None = None,
+                 database_url: str | None = None):
+        self.client = client
+        self.metrics = metrics
+        self.jobs = jobs
+        self.data_dir = data_dir
+        self.database_url = database_url
+        self.home_guild_id = home_guild_id
+        self.home_db = home_db
+        self._services = {}
+        self._locks = {}
+
+    def __iter__(self):
+        return iter(list(self._services.values()))
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+    def path_for(self, guild_id: int) -> str:
+        return os.path.join(self.data_dir, f"guild-{guild_id}.db")
+
+    def cached(self, guild_id: int | None) -> GuildServices | None:
+        return self._services.get(guild_id)
+
+    async def get(self, guild_id: int) -> GuildServices:
+        services = self._services.get(guild_id)
+        if services is not None:
+            return services
+
+        async with self._locks.setdefault(guild_id, asyncio.Lock()):
+            if guild_id not in self._services:
+                if guild_id == self.home_guild_id and self.home_db is not None:
+                    services = GuildServices(guild_id, self.home_db, self.client, self.jobs, owns_db=False)
+                else:
+                    if not self.database_url:
+                        os.makedirs(self.data_dir, exist_ok=True)
+                    db = open_repository(self.database_url, self.path_for(guild_id), self.metrics,
+                                         GUILD_READ_WORKERS, schema=f"guild_{guild_id}")
+                    services = GuildServices(guild_id, db, self.client, self.jobs)
+                await services.start()
+                self._services[guild_id] = services
+
+        return self._services[guild_id]
+
+    async def close(self):
+        for services in self:
+            await services.stop()
+        self._services = {}
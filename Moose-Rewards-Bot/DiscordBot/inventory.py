@@ -0,0 +1,100 @@
+import discord
+from discord.ui import View, Button
+
+from catalog import FIELD_NAME_LIMIT
+from repository import Repository
+from storage import INVENTORY_PAGE_SIZE
+
+DESCRIPTION_LIMIT = 200  # Keeps a full page well under the 6000 character embed limit
+SUMMARY_LIMIT = 25  # Embed fields per message
+
+
+class InventoryButton(Button):
+    def __init__(self, pager: "InventoryPager", label: str, newer: bool, disabled: bool):
+        super().__init__(label=label, style=discord.ButtonStyle.secondary, disabled=disabled)
+        self.pager = pager
+        self.newer = newer
+
+    async def callback(self, interaction: discord.Interaction):
+        await self.pager.turn(interaction, self.newer)
+
+
+class InventoryPager:
+    # One admin's walk through a member's purchases. Only the rows on screen
+    # are kept; each click fetches the next page from the (purchased_at, id)
+    # of the first or last row shown. The one view is reused for every page,
+    # with its buttons enabled or disabled to match, so paging doesn't leave
+    # a trail of views listening until they time out.
+
+    TIMEOUT = 600
+
+    def __init__(self, db: Repository, member: discord.Member):
+        self.db = db
+        self.member = member
+        self.rows = []
+        self.page = 0
+        self.has_older = False
+        self.view = View(timeout=self.TIMEOUT)
+        self._newer = InventoryButton(self, "◀ Newer", newer=True, disabled=True)
+        self._older = InventoryButton(self, "Older ▶", newer=False, disabled=True)
+        self.view.add_item(self._newer)
+        self.view.add_item(self._older)
+
+    async def first(self) -> tuple[discord.Embed, View] | None:
+        rows = await self.db.get_inventory_page(str(self.member.id), limit=INVENTORY_PAGE_SIZE + 1)
+        if not rows:
+            return None
+
+        self._show(rows, has_older=len(rows) > INVENTORY_PAGE_SIZE)
+        return self.render()
+
+    async def turn(self, interaction: discord.Interaction, newer: bool):
+        if newer:
+            first_id, first_at = self.rows[0][:2]
+            rows = await self.db.get_inventory_page(str(self.member.id), (first_at, first_id), newer=True)
+            if rows:
+                self.page = max(0, self.page - 1)
+                self._show(rows, has_older=True)
+        else:
+            last_id, last_at = self.rows[-1][:2]
+            rows = await self.db.get_inventory_page(str(self.member.id), (last_at, last_id),
+                                                    limit=INVENTORY_PAGE_SIZE + 1)
+            if rows:
+                self.page += 1
+                self._show(rows, has_older=len(rows) > INVENTORY_PAGE_SIZE)
+
+        embed, view = self.render()
+        await interaction.response.edit_message(embed=embed, view=view)
+
+    def _show(self, rows: list[tuple], has_older: bool):
+        self.rows = rows[:INVENTORY_PAGE_SIZE]
+        self.has_older = has_older
+
+    def render(self) -> tuple[discord.Embed, View]:
+        embed = discord.Embed(title=f"{self.member.display_name}'s Inventory", color=discord.Color.blue())
+        for _, purchased_at, name, description in self.rows:
+            embed.add_field(name=name[:FIELD_NAME_LIMIT],
+                            value=f"{description[:DESCRIPTION_LIMIT]}\n*Purchased at:* {purchased_at}", inline=False)
+        embed.set_footer(text=f"Page {self.page + 1}")
+
+        self._newer.disabled = self.page == 0
+        self._older.disabled = not self.has_older
+        return embed, self.view
+
+
+async def inventory_summary(db: Repository, member: discord.Member) -> discord.Embed | None:
+    rows = await db.get_inventory_summary(str(member.id))
+    if not rows:
+        return None
+
+    embed = discord.Embed(title=f"{member.display_name}'s Inventory", color=discord.Color.blue())
+    for name, count, last_purchased in rows[:SUMMARY_LIMIT]:
+        count_text = f" × {count}"
+        embed.add_field(name=name[:FIELD_NAME_LIMIT - len(count_text)] + count_text,
+                        value=f"*Last purchased:* {last_purchased}", inline=False)
+
+    owned = sum(count for _, count, _ in rows)
+    embed.description = f"**{owned}** items across **{len(rows)}** kinds"
+    if len(rows) > SUMMARY_LIMIT:
+        embed.set_footer(text=f"...and {len(rows) - SUMMARY_LIMIT} more kinds")
+    return embed
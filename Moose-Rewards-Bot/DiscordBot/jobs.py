@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import time
+
+import discord
+
+from metrics import Metrics
+
+WORKERS = 16
+MAX_QUEUED = 1000
+BUSY_MESSAGE = "⏳ The bot is busy right now, please try again in a moment."
+ERROR_MESSAGE = "⚠️ Something went wrong running that, please try again later."
+
+
+async def report_failure(interaction: discord.Interaction):
+    # For error handlers. A deferred interaction that never gets a followup
+    # shows "thinking..." until its token expires, so say it failed instead.
+    if not interaction.response.is_done():
+        return
+    try:
+        await interaction.followup.send(ERROR_MESSAGE, ephemeral=True)
+    except discord.HTTPException:
+        pass
+
+
+class CommandQueue:
+    # Keeps commands inside Discord's 3 second window for acknowledging an
+    # interaction, however long the database takes. Each interaction is
+    # deferred the moment it arrives; its work then waits for one of a fixed
+    # pool of worker tasks and answers through interaction.followup. When
+    # MAX_QUEUED jobs are already waiting, or a command is at its own limit,
+    # the request is turned away straight away with a "busy" reply rather
+    # than queueing behind work it would time out waiting for.
+
+    def __init__(self, metrics: Metrics, workers: int = WORKERS, max_queued: int = MAX_QUEUED):
+        self.metrics = metrics
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._tasks = []
+        self._in_flight = {}  # Queued or running jobs per command
+        self.busy = 0
+        self.stats = dict.fromkeys(("queued", "completed", "failed", "shed"), 0)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def run(self, interaction: discord.Interaction, name: str, work, limit: int | None = None,
+                  thinking: bool = True):
+        # Defers, queues work() and waits for it, so exceptions still reach
+        # the command tree's or view's error handler, which answers with
+        # report_failure. Buttons pass thinking=False: the clicked message
+        # stays as it is and work() replies with a new ephemeral followup.
+        await interaction.response.defer(ephemeral=True, thinking=thinking)
+
+        in_flight = self._in_flight.get(name, 0)
+        if (limit is not None and in_flight >= limit) or self._queue.full():
+            self.stats["shed"] += 1
+            self.metrics.increment("commands_shed")
+            await interaction.followup.send(BUSY_MESSAGE, ephemeral=True)
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[name] = in_flight + 1
+        self._queue.put_nowait((name, work, done, time.perf_counter()))
+        self.stats["queued"] += 1
+        await done
+
+    def deferred(self, limit: int | None = None):
+        # For app command callbacks, under the @tree.command decorators:
+        #
+        #   @client.tree.command(name="give", ...)
+        #   @jobs.deferred()
+        #   async def give_balance(interaction, member, amount): ...
+        #
+        # The callback then answers with interaction.followup.send.
+        def decorator(callback):
+            @functools.wraps(callback)
+            async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+                work = functools.partial(callback, interaction, *args, **kwargs)
+                await self.run(interaction, callback.__name__, work, limit)
+            return wrapper
+        return decorator
+
+    async def _worker(self):
+        while True:
+            name, work, done, queued_at = await self._queue.get()
+            self.metrics.observe_queue_wait(name, time.perf_counter() - queued_at)
+            self.busy += 1
+            try:
+                result = await work()
+            except Exception as e:
+                self.stats["failed"] += 1
+                if not done.done():
+                    done.set_exception(e)
+            else:
+                self.stats["completed"] += 1
+                if not done.done():
+                    done.set_result(result)
+            finally:
+                self.busy -= 1
+                self._in_flight[name] -= 1
+                self._queue.task_done()
@@ -1,399 +1,379 @@
-from datetime import datetime, timedelta
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import Literal
 from discord.ext import tasks
 import discord
 from discord import app_commands
-import sqlite3
 from discord.ext import commands
 import logging
-import os
+import time
 from dotenv import load_dotenv
-from discord.ui import View, Button
-
-def init_db():
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            discord_id TEXT PRIMARY KEY,
-            username TEXT NOT NULL,
-            referrals INTEGER DEFAULT 8
-        )
-    """)
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS point_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT NOT NULL,
-            points INTEGER NOT NULL,
-            earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL
-        )
-    """)
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS store_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            cost INTEGER NOT NULL,
-            description TEXT NOT NULL
-        )
-    """)
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS user_inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT NOT NULL,
-            item_id INTEGER NOT NULL,
-            purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (item_id) REFERENCES store_items (id)
-        )
-    """)
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-
-init_db()
-
-@tasks.loop(hours=24)
-async def cleanup_expired_points():
-    deleted = remove_expired_points()
-    print(f"[Point Cleanup] Removed {deleted} expired point entries.")
-
-def remove_expired_points():
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
+from backups import describe as describe_backup
+from config import Config, ConfigError
+from export import day_range, export_filename
+from gateway import MemberCache, client_options
+from guilds import GuildRouter, LOG_CHANNEL_KEY, TICKET_CATEGORY_KEY, TICKET_PROMPT_CHANNEL_KEY
+from inventory import InventoryPager, inventory_summary
+from jobs import CommandQueue, report_failure
+from metrics import Metrics
+from repository import BackendUnavailable, open_repository
+from storage import READ_WORKERS
+
+STARTED = time.perf_counter()
 
-    cur.execute("""
-        DELETE FROM point_entries
-        WHERE expires_at <= ?
-    """, (datetime.now(),))
+load_dotenv()
 
-    deleted = cur.rowcount  # Number of rows deleted (for logging)
-    conn.commit()
-    conn.close()
+try:
+    config = Config.from_env()
+except ConfigError as e:
+    sys.exit(f"Invalid configuration in .env:\n{e}")
+
+token = config.token
+
+METRICS_FILE = config.metrics_file
+METRICS_PORT = config.metrics_port
+
+# Nothing below touches the network or the database until the client starts,
+# so the module can be imported and its commands driven offline
+# (see scripts/fakes.py). db holds bot-wide settings and, if GUILD_ID is set,
+# that guild's data; each other guild gets its own file or schema (see guilds.py).
+metrics = Metrics()
+# Commands that touch the database are deferred at once and run here, see jobs.py
+jobs = CommandQueue(metrics)
+try:
+    db = open_repository(config.database_url, config.db_path, metrics, READ_WORKERS)
+except BackendUnavailable as e:
+    sys.exit(str(e))
+# Recent interactors, for looking members up when LOW_MEMORY leaves them uncached
+member_cache = MemberCache()
+
+@tasks.loop(hours=1)
+async def cleanup_expired_points():
+    for services in guilds:
+        sweep = await services.db.sweep_expired()
+        print(f"[Point Cleanup] Guild {services.guild_id}: removed {sweep['rows']} expired point entries "
+              f"in {sweep['chunks']} chunks ({sweep['seconds']}s).")
+        compaction = await services.db.compact_entries()
+        if compaction["rows"]:
+            print(f"[Point Cleanup] Guild {services.guild_id}: merged {compaction['rows']} point entries into "
+                  f"{compaction['buckets']} buckets ({compaction['seconds']}s).")
+        print(f"[Tickets] Guild {services.guild_id}: queue depth {services.ticket_queue.depth()}, "
+              f"stats: {services.ticket_queue.stats}")
+        print(f"[Audit] Guild {services.guild_id}: {services.audit.stats}")
+    print(f"[Storage] Pool stats: {db.pool_stats()}")
+
+@tasks.loop(hours=6)  # Changed to BACKUP_INTERVAL_HOURS at start
+async def backup_databases():
+    # Skips the iteration that runs at start, so restarts don't pile up snapshots
+    if backup_databases.current_loop == 0:
+        return
+    for repository in [db] + [services.db for services in guilds if services.db is not db]:
+        try:
+            result = await repository.backup(config.backup_dir, config.backup_keep)
+        except (sqlite3.Error, OSError) as e:
+            print(f"[Backup] Failed: {e}")
+            continue
+        if result:
+            print(f"[Backup] {describe_backup(result)}")
+
+@tasks.loop(seconds=15)
+async def dump_metrics():
+    await asyncio.to_thread(metrics.write, METRICS_FILE)
+
+class Tree(app_commands.CommandTree):
+    # Times every app command from dispatch to completion or error
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        member_cache.remember(interaction.user)
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        observe_command(interaction, failed=True)
+        await super().on_error(interaction, error)
+        await report_failure(interaction)
+
+def observe_command(interaction: discord.Interaction, failed: bool = False):
+    started = interaction.extras.get("started")
+    if started is not None and interaction.command is not None:
+        metrics.observe_command(interaction.command.qualified_name, time.perf_counter() - started, failed)
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: discord.abc.Snowflake | None = None) -> str:
+    # Hash of the payload tree.sync would upload
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands(tree: app_commands.CommandTree, guild: discord.abc.Snowflake | None = None) -> bool:
+    # Syncing is a rate-limited call that re-uploads every command, so it only
+    # happens when the definitions changed since the last successful sync
+    key = f"command_tree_hash:{guild.id if guild else 'global'}"
+    digest = command_tree_hash(tree, guild)
+    if db.get_setting(key) == digest and not config.force_sync:
+        return False
+
+    synced = await tree.sync(guild=guild)
+    await db.set_setting(key, digest)
+    print(f"Synced {len(synced)} commands " + (f"on guild {guild.id}" if guild else "globally"))
+    return True
+
+async def seed_home_guild():
+    # Carries the old single-guild .env channel IDs over to GUILD_ID's
+    # /setup settings, without overwriting anything set since
+    for key, value in ((LOG_CHANNEL_KEY, config.log_channel_id),
+                       (TICKET_CATEGORY_KEY, config.ticket_category_id),
+                       (TICKET_PROMPT_CHANNEL_KEY, config.ticket_prompt_channel_id)):
+        if value and db.get_setting(key) is None:
+            await db.set_setting(key, str(value))
+
+class Client(commands.AutoShardedBot):
+    async def setup_hook(self):
+        # Runs once per process, after login and before the gateway connects;
+        # on_ready runs again on every reconnect, so nothing expensive goes there
+        jobs.start()
+        timings = {}
+        stage = time.perf_counter()
+
+        await db.init()
+        if config.guild_id:
+            await seed_home_guild()
+            # Opens the home guild so its persistent store views are
+            # registered before the first click arrives
+            await guilds.get(config.guild_id)
+        timings["database"] = time.perf_counter() - stage
+        stage = time.perf_counter()
 
-    return deleted
+        try:
+            synced = await sync_commands(self.tree)
+            if config.guild_id:
+                # Clears the guild-only copies from before commands were global
+                synced = await sync_commands(self.tree, discord.Object(id=config.guild_id)) or synced
+        except discord.HTTPException as e:
+            synced = False
+            print(f"Failed to sync commands: {e}")
+        timings["command sync" if synced else "command sync (unchanged)"] = time.perf_counter() - stage
+
+        metrics.gauge("db_pool_open", lambda: db.pool_stats()["open"])
+        metrics.gauge("guilds_open", lambda: len(guilds))
+        metrics.gauge("ticket_queue_depth", lambda: sum(services.ticket_queue.depth() for services in guilds))
+        metrics.gauge("command_queue_depth", jobs.depth)
+        metrics.gauge("command_workers_busy", lambda: jobs.busy)
+        metrics.gauge("member_cache_size", lambda: len(member_cache))
+        metrics.gauge("backup_seconds", lambda: (db.last_backup or {}).get("seconds", 0))
+        metrics.gauge("backup_pages_per_second", lambda: (db.last_backup or {}).get("pages_per_second", 0))
+        if METRICS_PORT:
+            await metrics.serve(METRICS_PORT)
+            print(f"[Metrics] Serving Prometheus metrics on 127.0.0.1:{METRICS_PORT}")
+        if METRICS_FILE:
+            dump_metrics.start()
+        if config.backup_hours:
+            backup_databases.change_interval(hours=config.backup_hours)
+            backup_databases.start()
+
+        print("[Startup] " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()))
+
+    async def close(self):
+        await super().close()
+        if dump_metrics.is_running():
+            dump_metrics.cancel()
+        if backup_databases.is_running():
+            backup_databases.cancel()
+        await jobs.stop()
+        await guilds.close()
+        await db.close()
 
-class Client(commands.Bot):
     async def on_ready(self):
-        #await client.tree.sync()
-
-        print(f"{client.user.name} is online")
-        try:
-            guild = discord.Object(id=int(os.getenv("GUILD_ID")))
+        print(f"{client.user.name} is online in {len(self.guilds)} guilds on {self.shard_count} shards "
+              f"({time.perf_counter() - STARTED:.2f}s since start{', low-memory mode' if config.low_memory else ''})")
 
-            synced = await self.tree.sync(guild=guild)
-            print(f"Synced {len(synced)} commands on guild {guild.id}")
-        except Exception as e:
-            print(f"Failed to sync guild: {e}")
+        # Rebuild the open ticket index of every guild
+        for guild in self.guilds:
+            services = await guilds.get(guild.id)
+            await services.tickets.load(guild, services.ticket_queue.category_id, member_cache)
 
         # Start cleanup task
         if not cleanup_expired_points.is_running():
             cleanup_expired_points.start()
 
-load_dotenv()
-
-GUILD_ID = discord.Object(id=int(os.getenv("GUILD_ID")))
-LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID"))
-
-token = os.getenv('DISCORD_TOKEN')
-
+    async def on_guild_join(self, guild: discord.Guild):
+        print(f"Joined {guild.name} ({guild.id}), an admin can configure it with /setup")
+        await guilds.get(guild.id)
 
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-intents = discord.Intents.default()
-intents.reactions = True
-intents.guilds = True
-intents.message_content = True
-intents.members = True
-
-client = Client(command_prefix='/', intents=intents)
+client = Client(command_prefix='/', tree_cls=Tree, allowed_contexts=app_commands.AppCommandContext(guild=True),
+                **client_options(config.low_memory))
+guilds = GuildRouter(client, metrics, jobs, config.guild_data_dir, home_guild_id=config.guild_id,
+                     home_db=db, database_url=config.database_url)
 
 @client.event
 async def on_raw_reaction_add(payload):
+    # Only guilds already open; their settings are cached, so reactions on
+    # every other message cost no I/O
+    services = guilds.cached(payload.guild_id)
+    if services is None or str(payload.message_id) != services.db.get_setting("ticket_prompt_message_id"):
+        return
+
     if payload.member is None or payload.member.bot:
         return
+    member_cache.remember(payload.member)
 
     emoji = str(payload.emoji)
     if emoji != "🎫":
         return
 
-    ticket_message_id = int(get_setting("ticket_prompt_message_id"))
-
-    if payload.message_id != ticket_message_id:
-        return
-
-    guild = client.get_guild(payload.guild_id)
-    member = payload.member
-    channel = guild.get_channel(payload.channel_id)
-    message = await channel.fetch_message(payload.message_id)
-
-    # Remove the user's reaction
-    await message.remove_reaction(payload.emoji, payload.member)
-
-    # Check if the user already has an open ticket
-    existing = discord.utils.get(guild.text_channels, name=f"ticket-{member.name.lower()}")
-    if existing:
-        return
+    # Remove the user's reaction without fetching the message first
+    channel = client.get_channel(payload.channel_id)
+    if channel:
+        await channel.get_partial_message(payload.message_id).remove_reaction(payload.emoji, payload.member)
 
-    category_id = int(os.getenv("TICKET_CATEGORY_ID"))
-    category = discord.utils.get(guild.categories, id=category_id)
-    admin_role = discord.utils.get(guild.roles, name="Admin")
+    await services.ticket_queue.submit(payload.member)
 
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        member: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True),
-        admin_role: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True),
-    }
-
-    channel = await guild.create_text_channel(
-        name=f"ticket-{member.name}",
-        category=category,
-        overwrites=overwrites,
-        reason="Support ticket"
-    )
+@client.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    observe_command(interaction)
 
-    await channel.send(f"{member.mention} your ticket has been created. A staff member will be with you shortly.")
-
-def set_setting(key: str, value: str):
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO settings (key, value)
-        VALUES (?, ?)
-        ON CONFLICT(key) DO UPDATE SET value = excluded.value
-    """, (key, value))
-    conn.commit()
-    conn.close()
-
-def get_setting(key: str) -> str | None:
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cur.fetchone()
-    conn.close()
-    return row[0] if row else None
-
-def total_points(discord_id: str) -> int:
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT SUM(points)
-        FROM point_entries
-        WHERE discord_id = ?
-        AND expires_at > CURRENT_TIMESTAMP
-        """, (discord_id,))
-    result = cur.fetchone()
-
-    return result[0] if result else 0
-
-def spend_points(discord_id: str, amount: int) -> bool:
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    # Fetch unexpired point entries in FIFO order
-    cur.execute("""
-        SELECT id, points FROM point_entries
-        WHERE discord_id = ? AND expires_at > ?
-        ORDER BY earned_at ASC
-    """, (discord_id, datetime.now()))
-
-    rows = cur.fetchall()
-    remaining = amount
-
-    for row in rows:
-        entry_id, available = row
-
-        if available > remaining:
-            cur.execute("UPDATE point_entries SET points = points - ? WHERE id = ?", (remaining, entry_id))
-        else:
-            cur.execute("DELETE FROM point_entries WHERE id = ?", (entry_id,))
-            remaining -= available
-        if remaining == 0:
-            break
-
-    conn.commit()
-    conn.close()
-
-    return remaining == 0  # True if fully spent
-
-@client.tree.command(name="points", description="Shows your balance", guild=GUILD_ID)
+@client.event
+async def on_guild_channel_delete(channel):
+    # Ticket channels deleted by hand rather than with /close
+    services = guilds.cached(channel.guild.id)
+    if services is not None and services.tickets.owner_of(channel.id) is not None:
+        await services.tickets.close(channel.id)
+
+@client.tree.command(name="points", description="Shows your balance")
+@jobs.deferred()
 async def points(interaction: discord.Interaction):
-    remove_expired_points()
+    services = await guilds.get(interaction.guild_id)
     user_id = str(interaction.user.id)
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM users WHERE discord_id = ?", (user_id,))
-
-    if not cur.fetchone():
-        await interaction.response.send_message("You're not registered yet!", ephemeral=True)
+    if not await services.db.is_registered(user_id):
+        await interaction.followup.send("You're not registered yet!", ephemeral=True)
         return
 
-    conn.close()
-
-    points = total_points(user_id)
-    await interaction.response.send_message(f"Current points: **{points}**", ephemeral=True)
+    points = await services.db.total_points(user_id)
+    await interaction.followup.send(f"Current points: **{points}**", ephemeral=True)
 
-@client.tree.command(name="store", description="Opens the point store", guild = GUILD_ID)
+@client.tree.command(name="store", description="Opens the point store")
+@jobs.deferred()
 async def store(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
     user_id = str(interaction.user.id)
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    # Get total available points]
-    user_points = total_points(user_id)
+    # Get total available points
+    user_points = await services.db.total_points(user_id)
 
     if user_points == 0:
-        await interaction.response.send_message("You have no points!", ephemeral=True)
-        conn.close()
+        await interaction.followup.send("You have no points!", ephemeral=True)
         return
 
-    # Fetch store items
-    cur.execute("SELECT id, name, cost, description FROM store_items")
-    items = cur.fetchall()
+    # Cached page with this user's balance filled in
+    page = await services.catalog.render(user_points)
 
-    if not items:
-        await interaction.response.send_message("The store is currently empty.", ephemeral=True)
-        conn.close()
+    if page is None:
+        await interaction.followup.send("The store is currently empty.", ephemeral=True)
         return
 
-    embed = discord.Embed(title="🛒 Point Store", description=f"You have **{user_points}** points",
-                          color=discord.Color.green())
-    view = View()
-
-    for item_id, name, cost, description in items:
-        embed.add_field(name=f"{name} - {cost} pts", value=description, inline=False)
-
-        async def buy_callback(interact: discord.Interaction, item_id=item_id, name=name, cost=cost):
-            conn = sqlite3.connect("points.db")
-            cur = conn.cursor()
-
-            # Recalculate user's valid points
-            total = total_points(user_id)
-            if total < cost:
-                await interact.response.send_message("You don't have enough points!", ephemeral=True)
-                conn.close()
-                return
-
-            spend_points(user_id, cost)
-
-            cur.execute("""
-                INSERT INTO user_inventory (discord_id, item_id)
-                VALUES (?, ?)
-                """, (user_id, item_id))
+    embed, view = page
+    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
-            conn.commit()
-            conn.close()
-            await interact.response.send_message(f"You bought **{name}** for {cost} points!", ephemeral=True)
-
-        button = Button(label=f"Buy {name}", style=discord.ButtonStyle.primary)
-        button.callback = buy_callback
-        view.add_item(button)
-
-    conn.close()
-    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
-
-@client.tree.command(name="register", description="Register for the rewards program", guild = GUILD_ID)
+@client.tree.command(name="register", description="Register for the rewards program")
 @app_commands.describe(username="Minecraft username")
+@jobs.deferred()
 async def register(interaction: discord.Interaction, username: str):
+    services = await guilds.get(interaction.guild_id)
     discord_id = str(interaction.user.id)
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    # Check if already registered
-    cur.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
-    if cur.fetchone():
-        await interaction.response.send_message("You're already registered!", ephemeral=True)
+    if await services.db.register_user(discord_id, username):
+        await interaction.followup.send(f"Registered {username} successfully!", ephemeral=True)
     else:
-        cur.execute("INSERT INTO users (discord_id, username) VALUES (?, ?)", (discord_id, username))
-        conn.commit()
-        await interaction.response.send_message(f"Registered {username} successfully!", ephemeral=True)
+        await interaction.followup.send("You're already registered!", ephemeral=True)
 
-    conn.close()
-
-@client.tree.command(name="referral", description="Register for the rewards program", guild = GUILD_ID)
+@client.tree.command(name="referral", description="Register for the rewards program")
 @app_commands.describe(username="Minecraft username")
+@jobs.deferred()
 async def referral(interaction: discord.Interaction, username: str, member: discord.Member):
+    services = await guilds.get(interaction.guild_id)
     discord_id = str(interaction.user.id)
     referral_id = str(member.id)
     amount = 50
 
     if discord_id == referral_id:
-        await interaction.response.send_message("You cannot refer yourself!", ephemeral=True)
+        await interaction.followup.send("You cannot refer yourself!", ephemeral=True)
         return
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
+    status = await services.db.register_referral(discord_id, username, referral_id, amount)
 
-    # Check if user is already registered
-    cur.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
-    if cur.fetchone():
-        await interaction.response.send_message("You're already registered!", ephemeral=True)
-        conn.close()
+    if status == "already_registered":
+        await interaction.followup.send("You're already registered!", ephemeral=True)
         return
-
-    # Check if referral exists
-    cur.execute("SELECT referrals FROM users WHERE discord_id = ?", (referral_id,))
-    row = cur.fetchone()
-    if not row:
-        await interaction.response.send_message("The referred member is not registered!", ephemeral=True)
-        conn.close()
+    if status == "referrer_missing":
+        await interaction.followup.send("The referred member is not registered!", ephemeral=True)
         return
-    if row[0] == 0:
-        await interaction.response.send_message("The referred member cannot receive more referrals!", ephemeral=True)
-        conn.close()
+    if status == "no_referrals":
+        await interaction.followup.send("The referred member cannot receive more referrals!", ephemeral=True)
         return
 
-    # Register new user
-    cur.execute("INSERT INTO users (discord_id, username) VALUES (?, ?)", (discord_id, username))
-    conn.commit()
+    await interaction.followup.send(
+        f"Registered successfully! {member.display_name} has earned {amount} points for referring you.", ephemeral=True)
 
-    # Reward referrer
-    now = datetime.now()
-    expiry = now + timedelta(days=180)
-    cur.execute("""
-        INSERT INTO point_entries (discord_id, points, earned_at, expires_at)
-        VALUES (?, ?, ?, ?)
-    """, (referral_id, amount, now, expiry))
+    await services.audit.log("referral", f"✅ **{member}** got **{amount}** points from referring **{interaction.user}**.",
+                             actor_id=interaction.user.id, target_id=member.id, amount=amount)
 
-    cur.execute("UPDATE users SET referrals = referrals - 1 WHERE discord_id = ?", (referral_id,))
-    conn.commit()
-    conn.close()
+def ranking(rows: list[tuple], unit: str) -> str:
+    medals = ["🥇", "🥈", "🥉"]
+    return "\n".join(
+        f"{medals[rank] if rank < len(medals) else f'**{rank + 1}.**'} <@{discord_id}> - **{value}** {unit}"
+        for rank, (discord_id, value) in enumerate(rows)
+    )
 
-    await interaction.response.send_message(
-        f"Registered successfully! {member.display_name} has earned {amount} points for referring you.", ephemeral=True)
+@client.tree.command(name="leaderboard", description="Top earners of all time")
+@jobs.deferred()
+async def leaderboard(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
+    rows = await services.db.top_earners(10)
+
+    if not rows:
+        await interaction.followup.send("Nobody has earned any points yet.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="🏆 Leaderboard", description=ranking(rows, "points earned"),
+                          color=discord.Color.gold())
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
-    log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(f"✅ **{member}** got **{amount}** points from referring **{interaction.user}**.")
+@client.tree.command(name="topspenders", description="Members who have spent the most points")
+@jobs.deferred()
+async def topspenders(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
+    rows = await services.db.top_spenders(10)
 
-@client.tree.command(name="close", description="Closes your ticket", guild=GUILD_ID)
+    if not rows:
+        await interaction.followup.send("Nobody has bought anything yet.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="💸 Top Spenders", description=ranking(rows, "points spent"),
+                          color=discord.Color.gold())
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@client.tree.command(name="close", description="Closes your ticket")
 async def close_ticket(interaction: discord.Interaction, reason: str):
+    services = await guilds.get(interaction.guild_id)
     channel = interaction.channel
     author = interaction.user
     guild = interaction.guild
 
     # Must be a ticket channel
-    if not channel.name.startswith("ticket-"):
+    owner_id = services.tickets.owner_of(channel.id)
+    if owner_id is None:
         await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
         return
 
     # Check if the user is the ticket owner or an Admin
     admin_role = discord.utils.get(guild.roles, name="Admin")
-    ticket_owner_name = channel.name.replace("ticket-", "")
     is_admin = admin_role in author.roles if admin_role else False
-    is_owner = ticket_owner_name.lower() == author.name.lower()
+    is_owner = owner_id == author.id
 
     if not (is_admin or is_owner):
         await interaction.response.send_message("You don't have permission to close this ticket.", ephemeral=True)
@@ -402,187 +382,347 @@ async def close_ticket(interaction: discord.Interaction, reason: str):
     await interaction.response.send_message("Closing this ticket... 👋", ephemeral=True)
     await channel.send(f"Ticket closed by {author.mention}. Deleting channel...")
 
-    log_channel = guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(f"📁 Ticket **#{channel.name}** closed by **{author.display_name}**\n**Reason:** {reason}")
+    await services.audit.log("ticket_closed",
+                             f"📁 Ticket **#{channel.name}** closed by **{author.display_name}**\n**Reason:** {reason}",
+                             actor_id=author.id, target_id=owner_id)
 
+    await services.tickets.close(channel.id)
     await channel.delete()
 
 # Admin commands
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="remove", description="Removes balance", guild = GUILD_ID)
+@client.tree.command(name="remove", description="Removes balance")
 @app_commands.describe(member="Discord Member", amount="Amount to take")
+@jobs.deferred()
 async def remove_balance(interaction: discord.Interaction, member: discord.Member, amount: int):
+    services = await guilds.get(interaction.guild_id)
     user_id = str(member.id)
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM users WHERE discord_id = ?", (user_id,))
-    if not cur.fetchone():
-        await interaction.response.send_message("User not registered!", ephemeral=True)
-        conn.close()
+    if not await services.db.remove_points(user_id, amount):
+        await interaction.followup.send("User not registered!", ephemeral=True)
         return
 
-    conn.commit()
-    conn.close()
-
-    spend_points(user_id, amount)
+    await interaction.followup.send(f"Removed **{amount}** points from {member.display_name}!", ephemeral=True)
 
-    await interaction.response.send_message(f"Removed **{amount}** points from {member.display_name}!", ephemeral=True)
-
-    log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(f"🛑 **{interaction.user.mention}** removed **£{amount}** points from **{member.mention}**")
+    await services.audit.log("remove", f"🛑 **{interaction.user.mention}** removed **£{amount}** points from **{member.mention}**",
+                             actor_id=interaction.user.id, target_id=member.id, amount=amount)
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="give", description="Gives balance", guild = GUILD_ID)
+@client.tree.command(name="give", description="Gives balance")
 @app_commands.describe(member="Discord Member", amount="Amount to give")
+@jobs.deferred()
 async def give_balance(interaction: discord.Interaction, member: discord.Member, amount: int):
+    services = await guilds.get(interaction.guild_id)
     user_id = str(member.id)
 
-    now = datetime.now()
-    expiry = now + timedelta(days=180)
+    if not await services.db.give_points(user_id, amount):
+        await interaction.followup.send("User not registered!", ephemeral=True)
+        return
+
+    await interaction.followup.send(f"Gave **{amount}** points to {member.display_name}!", ephemeral=True)
+
+    await services.audit.log("give", f"✅ **{interaction.user.mention}** gave **{amount}** points to **{member.mention}**",
+                             actor_id=interaction.user.id, target_id=member.id, amount=amount)
+
+async def bulk_targets(amount: int, role: discord.Role | None,
+                       csv_file: discord.Attachment | None) -> tuple[list[tuple[str, int]], list[str]]:
+    # (discord_id, amount) pairs from a role's members and/or a CSV whose rows
+    # are a Discord ID or mention with an optional per-row amount, one pair
+    # per member: a CSV row overrides the role's default amount. Also returns
+    # the CSV rows that were rejected, as "line N: reason" for the reply.
+    targets = {}
+    rejected = []
+
+    if role:
+        targets.update((str(member.id), amount) for member in await member_cache.role_members(role) if not member.bot)
+
+    if csv_file:
+        text = (await csv_file.read()).decode("utf-8-sig")
+        from_csv = set()
+        for line, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+            if not row or not "".join(row).strip():
+                continue
+            discord_id = row[0].strip().strip("<@!>")
+            if not discord_id.isdigit():
+                if line == 1:
+                    continue  # Header
+                rejected.append(f"line {line}: `{row[0].strip()[:40]}` is not a Discord ID")
+                continue
+            if discord_id in from_csv:
+                rejected.append(f"line {line}: <@{discord_id}> is listed twice")
+                continue
+
+            row_amount = row[1].strip() if len(row) > 1 else ""
+            if row_amount and not (row_amount.isdigit() and int(row_amount) > 0):
+                rejected.append(f"line {line}: `{row_amount[:20]}` is not a positive amount")
+                continue
+            from_csv.add(discord_id)
+            targets[discord_id] = int(row_amount) if row_amount else amount
+
+    return list(targets.items()), rejected
+
+def rejected_rows(rejected: list[str], limit: int = 10) -> str:
+    # Reply lines listing the CSV rows bulk_targets turned down
+    if not rejected:
+        return ""
+    lines = [f"\nRejected {len(rejected)} CSV rows:"] + [f"- {reason}" for reason in rejected[:limit]]
+    if len(rejected) > limit:
+        lines.append(f"- ...and {len(rejected) - limit} more")
+    return "\n".join(lines)
+
+def bulk_source(role: discord.Role | None, csv_file: discord.Attachment | None) -> str:
+    sources = []
+    if role:
+        sources.append(f"role {role.mention}")
+    if csv_file:
+        sources.append(f"`{csv_file.filename}`")
+    return " and ".join(sources)
+
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="givebulk", description="Gives balance to a role or a CSV of members")
+@app_commands.describe(amount="Amount to give each member", role="Give to everyone with this role",
+                       csv_file="CSV of Discord IDs, optionally with an amount per row")
+@jobs.deferred(limit=1)  # One import at a time; a big CSV holds the writer for its whole transaction
+async def give_bulk(interaction: discord.Interaction, amount: int, role: discord.Role | None = None,
+                    csv_file: discord.Attachment | None = None):
+    services = await guilds.get(interaction.guild_id)
+    if role is None and csv_file is None:
+        await interaction.followup.send("Pick a role or attach a CSV.", ephemeral=True)
+        return
+    if amount <= 0:
+        await interaction.followup.send("The amount must be a positive number of points.", ephemeral=True)
+        return
+
+    targets, rejected = await bulk_targets(amount, role, csv_file)
+    applied, skipped = await services.db.bulk_give(targets)
+    total = sum(points for _, points in applied)
+
+    if not applied:
+        reason = "none of those members are registered." if targets else "no members were found."
+        await interaction.followup.send("No points were given: " + reason + rejected_rows(rejected),
+                                        ephemeral=True)
+        return
+
+    summary = f"Gave **{total}** points to **{len(applied)}** members."
+    if skipped:
+        summary += f" Skipped {len(skipped)} unregistered."
+    summary += rejected_rows(rejected)
+    await interaction.followup.send(summary, ephemeral=True)
 
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
+    await services.audit.log("give_bulk", f"✅ **{interaction.user.mention}** gave **{total}** points to **{len(applied)}** "
+                                          f"members from {bulk_source(role, csv_file)}",
+                             actor_id=interaction.user.id, amount=total)
 
-    cur.execute("SELECT * FROM users WHERE discord_id = ?", (user_id,))
-    if not cur.fetchone():
-        await interaction.response.send_message("User not registered!", ephemeral=True)
-        conn.close()
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="removebulk", description="Removes balance from a role or a CSV of members")
+@app_commands.describe(amount="Amount to take from each member", role="Take from everyone with this role",
+                       csv_file="CSV of Discord IDs, optionally with an amount per row")
+@jobs.deferred(limit=1)
+async def remove_bulk(interaction: discord.Interaction, amount: int, role: discord.Role | None = None,
+                      csv_file: discord.Attachment | None = None):
+    services = await guilds.get(interaction.guild_id)
+    if role is None and csv_file is None:
+        await interaction.followup.send("Pick a role or attach a CSV.", ephemeral=True)
+        return
+    if amount <= 0:
+        await interaction.followup.send("The amount must be a positive number of points.", ephemeral=True)
         return
 
-    cur.execute("""
-                INSERT INTO point_entries (discord_id, points, earned_at, expires_at)
-                VALUES (?, ?, ?, ?)
-                """, (user_id, amount, now, expiry))
+    targets, rejected = await bulk_targets(amount, role, csv_file)
+    applied, skipped = await services.db.bulk_remove(targets)
+    total = sum(points for _, points in applied)
 
-    conn.commit()
-    conn.close()
+    if not applied:
+        reason = "none of those members are registered." if targets else "no members were found."
+        await interaction.followup.send("No points were removed: " + reason + rejected_rows(rejected),
+                                        ephemeral=True)
+        return
 
-    await interaction.response.send_message(f"Gave **{amount}** points to {member.display_name}!", ephemeral=True)
+    summary = f"Removed **{total}** points from **{len(applied)}** members."
+    if skipped:
+        summary += f" Skipped {len(skipped)} unregistered."
+    summary += rejected_rows(rejected)
+    await interaction.followup.send(summary, ephemeral=True)
 
-    log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(f"✅ **{interaction.user.mention}** gave **{amount}** points to **{member.mention}**")
+    await services.audit.log("remove_bulk", f"🛑 **{interaction.user.mention}** removed **{total}** points from "
+                                            f"**{len(applied)}** members from {bulk_source(role, csv_file)}",
+                             actor_id=interaction.user.id, amount=total)
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="additem", description="Add or update an item in the point store", guild=GUILD_ID)
+@client.tree.command(name="additem", description="Add or update an item in the point store")
 @app_commands.describe(name="Name of the item", cost="Cost in points", description="Description of the item")
+@jobs.deferred()
 async def additem(interaction: discord.Interaction, name: str, cost: int, description: str):
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    # Check if item already exists (by name)
-    cur.execute("SELECT id FROM store_items WHERE name = ?", (name,))
-    row = cur.fetchone()
+    services = await guilds.get(interaction.guild_id)
+    updated = await services.db.upsert_item(name, cost, description)
+    services.catalog.invalidate()
 
-    if row:
-        cur.execute("UPDATE store_items SET cost = ?, description = ? WHERE id = ?", (cost, description, row[0]))
-        await interaction.response.send_message(f"Updated item **{name}** in the store.", ephemeral=True)
+    if updated:
+        await interaction.followup.send(f"Updated item **{name}** in the store.", ephemeral=True)
     else:
-        cur.execute("INSERT INTO store_items (name, cost, description) VALUES (?, ?, ?)", (name, cost, description))
-        await interaction.response.send_message(f"Added item **{name}** to the store.", ephemeral=True)
-
-    conn.commit()
-    conn.close()
+        await interaction.followup.send(f"Added item **{name}** to the store.", ephemeral=True)
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="removeitem", description="Remove an item in the point store", guild=GUILD_ID)
+@client.tree.command(name="removeitem", description="Remove an item in the point store")
 @app_commands.describe(name="Name of the item")
+@jobs.deferred()
 async def remove_item(interaction: discord.Interaction, name: str):
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
+    services = await guilds.get(interaction.guild_id)
+    removed = await services.db.delete_item(name)
+    services.catalog.invalidate()
 
-    # Check if item exists (by name)
-    cur.execute("SELECT id FROM store_items WHERE name = ?", (name,))
-    row = cur.fetchone()
-
-    if row:
-        cur.execute("DELETE FROM store_items WHERE id = ?", (row[0]))
-        await interaction.response.send_message(f"Removed item **{name}** from the store.", ephemeral=True)
+    if removed:
+        await interaction.followup.send(f"Removed item **{name}** from the store.", ephemeral=True)
     else:
-        await interaction.response.send_message(f"No item named **{name}** found in the store.", ephemeral=True)
-
-    conn.commit()
-    conn.close()
+        await interaction.followup.send(f"No item named **{name}** found in the store.", ephemeral=True)
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="inventory", description="View a user's purchased inventory", guild=GUILD_ID)
-@app_commands.describe(member="The member whose inventory you want to see")
-async def inventory(interaction: discord.Interaction, member: discord.Member):
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT s.name, s.description, i.purchased_at
-        FROM user_inventory i
-        JOIN store_items s ON i.item_id = s.id
-        WHERE i.discord_id = ?
-        ORDER BY i.purchased_at DESC
-    """, (str(member.id),))
-    items = cur.fetchall()
-    conn.close()
-
-    if not items:
-        await interaction.response.send_message(f"{member.display_name} has no items in their inventory.", ephemeral=True)
+@client.tree.command(name="storestats", description="Best-selling store items")
+@jobs.deferred()
+async def storestats(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
+    rows = await services.db.top_items(10)
+
+    if not rows:
+        await interaction.followup.send("No items have been sold yet.", ephemeral=True)
         return
 
-    embed = discord.Embed(title=f"{member.display_name}'s Inventory", color=discord.Color.blue())
-    for name, desc, purchased_at in items:
-        embed.add_field(name=name, value=f"{desc}\n*Purchased at:* {purchased_at}", inline=False)
+    embed = discord.Embed(title="📈 Store Sales", color=discord.Color.green())
+    for name, purchases, points in rows:
+        embed.add_field(name=name, value=f"{purchases} sold for {points} points", inline=False)
 
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="removeuseritem", description="Remove the oldest instance of an item from a user's inventory", guild=GUILD_ID)
+@client.tree.command(name="inventory", description="View a user's purchased inventory")
+@app_commands.describe(member="The member whose inventory you want to see",
+                       summary="Show how many of each item they own instead of every purchase")
+@jobs.deferred()
+async def inventory(interaction: discord.Interaction, member: discord.Member, summary: bool = False):
+    services = await guilds.get(interaction.guild_id)
+    if summary:
+        embed = await inventory_summary(services.db, member)
+        view = None
+    else:
+        page = await InventoryPager(services.db, member).first()
+        embed, view = page if page else (None, None)
+
+    if embed is None:
+        await interaction.followup.send(f"{member.display_name} has no items in their inventory.", ephemeral=True)
+        return
+
+    if view is None:
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    else:
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="removeuseritem", description="Remove the oldest instance of an item from a user's inventory")
 @app_commands.describe(member="The member whose inventory item to remove", item_name="Name of the item to remove")
+@jobs.deferred()
 async def removeuseritem(interaction: discord.Interaction, member: discord.Member, item_name: str):
-    conn = sqlite3.connect("points.db")
-    cur = conn.cursor()
-
-    # Find the item ID from the store by name
-    cur.execute("SELECT id FROM store_items WHERE name = ?", (item_name,))
-    item = cur.fetchone()
-    if not item:
-        await interaction.response.send_message(f"Item **{item_name}** not found in store.", ephemeral=True)
-        conn.close()
+    services = await guilds.get(interaction.guild_id)
+    status = await services.db.remove_user_item(str(member.id), item_name)
+
+    if status == "no_item":
+        await interaction.followup.send(f"Item **{item_name}** not found in store.", ephemeral=True)
+        return
+    if status == "not_owned":
+        await interaction.followup.send(f"{member.display_name} does not own any **{item_name}**.", ephemeral=True)
         return
 
-    item_id = item[0]
-
-    # Get the oldest (FIFO) inventory entry for this item and user
-    cur.execute("""
-        SELECT id
-        FROM user_inventory
-        WHERE discord_id = ?
-          AND item_id = ?
-        ORDER BY purchased_at ASC
-        LIMIT 1
-    """, (str(member.id), item_id))
-    inventory_entry = cur.fetchone()
-
-    if not inventory_entry:
-        await interaction.response.send_message(f"{member.display_name} does not own any **{item_name}**.", ephemeral=True)
-        conn.close()
+    await interaction.followup.send(
+        f"Removed the oldest **{item_name}** from {member.display_name}'s inventory.", ephemeral=True
+    )
+
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="reconcile", description="Rebuild point balances from the ledger and report drift")
+@jobs.deferred(limit=1)
+async def reconcile(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
+    drift = await services.db.reconcile_balances()
+
+    if not drift:
+        await interaction.followup.send("All balances match the ledger.", ephemeral=True)
         return
 
-    # Delete the oldest inventory entry
-    cur.execute("DELETE FROM user_inventory WHERE id = ?", (inventory_entry[0],))
-    conn.commit()
-    conn.close()
+    lines = [f"<@{discord_id}>: stored **{stored}**, actual **{actual}**" for discord_id, stored, actual in drift[:20]]
+    if len(drift) > 20:
+        lines.append(f"...and {len(drift) - 20} more")
 
-    await interaction.response.send_message(
-        f"Removed the oldest **{item_name}** from {member.display_name}'s inventory.", ephemeral=True
+    await interaction.followup.send(
+        f"Fixed drift for **{len(drift)}** users:\n" + "\n".join(lines), ephemeral=True
     )
 
 @app_commands.checks.has_role("Admin")
-@client.tree.command(name="ticketsetup", description="Post the ticket creation message", guild=GUILD_ID)
+@client.tree.command(name="export", description="Download the ledger, purchases or members as a gzipped file")
+@app_commands.describe(table="ledger: point grants, inventory: purchases, users: registered members",
+                       file_format="CSV for spreadsheets, JSONL for scripts", member="Only this member's rows",
+                       since="First day to include, YYYY-MM-DD", until="Last day to include, YYYY-MM-DD")
+@jobs.deferred(limit=1)  # One at a time; a full export reads the whole table
+async def export_data(interaction: discord.Interaction, table: Literal["ledger", "inventory", "users"],
+                      file_format: Literal["csv", "jsonl"] = "csv", member: discord.User | None = None,
+                      since: str | None = None, until: str | None = None):
+    services = await guilds.get(interaction.guild_id)
+    try:
+        start, end = day_range(since, until)
+    except ValueError:
+        await interaction.followup.send("Dates must look like 2025-01-31.", ephemeral=True)
+        return
+    if table == "users" and (start or end):
+        await interaction.followup.send("The users export has no dates to filter by.", ephemeral=True)
+        return
+
+    # Streamed to a temp file and uploaded from disk, never held in memory
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, export_filename(table, file_format))
+        result = await services.db.export(path, table, file_format, str(member.id) if member else None, start, end)
+
+        if os.path.getsize(path) > interaction.guild.filesize_limit:
+            await interaction.followup.send(
+                f"The export has {result['rows']} rows, too big to attach here. Narrow it down with member, "
+                f"since or until, or run `python -m export {table}` on the bot's host.", ephemeral=True)
+            return
+
+        await interaction.followup.send(f"Exported **{result['rows']}** rows in {result['seconds']}s.",
+                                        file=discord.File(path), ephemeral=True)
+
+    await services.audit.log("export", f"📤 **{interaction.user.mention}** exported **{result['rows']}** {table} rows",
+                             actor_id=interaction.user.id, target_id=member.id if member else None)
+
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="setup", description="Configure the bot's channels for this server")
+@app_commands.describe(log_channel="Where audit events are posted",
+                       ticket_category="Category new ticket channels are created in",
+                       ticket_prompt_channel="Where /ticketsetup posts the ticket message")
+@jobs.deferred()
+async def setup(interaction: discord.Interaction, log_channel: discord.TextChannel | None = None,
+                ticket_category: discord.CategoryChannel | None = None,
+                ticket_prompt_channel: discord.TextChannel | None = None):
+    services = await guilds.get(interaction.guild_id)
+
+    for key, channel in ((LOG_CHANNEL_KEY, log_channel),
+                         (TICKET_CATEGORY_KEY, ticket_category),
+                         (TICKET_PROMPT_CHANNEL_KEY, ticket_prompt_channel)):
+        if channel is not None:
+            await services.db.set_setting(key, str(channel.id))
+    services.configure()
+
+    def show(key: str) -> str:
+        channel_id = services.setting_id(key)
+        return f"<#{channel_id}>" if channel_id else "not set"
+
+    await interaction.followup.send(
+        f"**Log channel:** {show(LOG_CHANNEL_KEY)}\n"
+        f"**Ticket category:** {show(TICKET_CATEGORY_KEY)}\n"
+        f"**Ticket prompt channel:** {show(TICKET_PROMPT_CHANNEL_KEY)}", ephemeral=True)
+
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="ticketsetup", description="Post the ticket creation message")
 async def ticketsetup(interaction: discord.Interaction):
-    ticket_channel_id = int(os.getenv("TICKET_PROMPT_CHANNEL_ID"))  # Add this to your .env
-    ticket_channel = interaction.guild.get_channel(ticket_channel_id)
+    services = await guilds.get(interaction.guild_id)
+    ticket_channel = interaction.guild.get_channel(services.setting_id(TICKET_PROMPT_CHANNEL_KEY) or 0)
 
     if not ticket_channel:
         await interaction.response.send_message("Ticket channel not found.", ephemeral=True)
@@ -597,8 +737,43 @@ async def ticketsetup(interaction: discord.Interaction):
     await message.add_reaction("🎫")
 
     # Save the message ID
-    set_setting("ticket_prompt_message_id", str(message.id))
+    await services.db.set_setting("ticket_prompt_message_id", str(message.id))
 
     await interaction.response.send_message("Ticket message posted and reaction added.", ephemeral=True)
 
-client.run(token)
\ No newline at end of file
+@app_commands.checks.has_role("Admin")
+@client.tree.command(name="stats", description="Command and database latency since startup")
+async def stats(interaction: discord.Interaction):
+    services = await guilds.get(interaction.guild_id)
+    header = f"{'name':<18} {'calls':>6} {'p50 ms':>7} {'p99 ms':>7} {'err':>4}"
+    embed = discord.Embed(title="📊 Bot Stats", color=discord.Color.blurple())
+    embed.add_field(name="Commands", value="```\n" + "\n".join([header] + metrics.summary(metrics.commands)) + "\n```",
+                    inline=False)
+    embed.add_field(name="Database", value="```\n" + "\n".join([header] + metrics.summary(metrics.queries)) + "\n```",
+                    inline=False)
+
+    slow = [f"{when:%H:%M:%S} {name} {seconds * 1000:.0f}ms" for when, name, seconds, _ in list(metrics.slow_queries)[-5:]]
+    embed.add_field(name="Slow queries", value="\n".join(slow) or "None", inline=False)
+
+    pool = services.db.pool_stats()
+    embed.add_field(name="Pool", value=f"{pool['open']} open, {pool['checkouts']} checkouts, "
+                                       f"{pool['max_wait_ms']}ms max wait", inline=False)
+    embed.add_field(name="Command queue", value=f"{jobs.depth()} queued, {jobs.busy}/{jobs.workers} workers busy, "
+                                                f"{jobs.stats['shed']} shed", inline=False)
+    embed.add_field(name="Members", value=f"{len(member_cache)} recent interactors cached, {member_cache.stats['hits']} hits, "
+                                          f"{member_cache.stats['fetched']} fetched", inline=False)
+    embed.add_field(name="Tickets", value=f"Queue depth {services.ticket_queue.depth()}, "
+                                          f"{services.ticket_queue.stats['created']} created", inline=False)
+    backup = services.db.last_backup
+    embed.add_field(name="Backup", value=f"{backup['finished_at']:%Y-%m-%d %H:%M}, {backup['pages']} pages in "
+                                         f"{backup['copy_seconds']}s ({backup['pages_per_second']} pages/s)"
+                    if backup else "None since start", inline=False)
+    embed.add_field(name="Audit", value=f"{services.audit.stats['sent']} sent, "
+                                        f"{services.audit.stats['failed']} failed", inline=False)
+    embed.set_footer(text=f"{len(guilds)} guilds open in this process")
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+if __name__ == "__main__":
+    handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
+    client.run(token, log_handler=handler)
\ No newline at end of file
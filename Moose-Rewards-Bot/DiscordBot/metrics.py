@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Histogram bucket upper bounds in seconds, from a cached read to a stuck
+# REST call. Prometheus adds the +Inf bucket on top.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_SAMPLES = 20
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation, or the
+        # largest one seen if it fell past the last bucket
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max
+        return self.max
+
+
+class Metrics:
+    # In-memory counters for app commands and storage helpers. Storage
+    # helpers report from the storage threads, so every update takes the
+    # lock. Nothing is persisted; numbers start over with the process.
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.commands = {}
+        self.queries = {}
+        self.queue_waits = {}
+        self.counters = {}
+        self.gauges = {}
+        self.slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def _series(self, table: dict, name: str) -> dict:
+        series = table.get(name)
+        if series is None:
+            series = table[name] = {"calls": 0, "errors": 0, "rows": 0, "latency": Histogram()}
+        return series
+
+    def observe_command(self, name: str, seconds: float, failed: bool = False):
+        with self._lock:
+            series = self._series(self.commands, name)
+            series["calls"] += 1
+            series["errors"] += failed
+            series["latency"].observe(seconds)
+
+    def observe_query(self, name: str, seconds: float, rows: int = 0, failed: bool = False, args: tuple = ()):
+        with self._lock:
+            series = self._series(self.queries, name)
+            series["calls"] += 1
+            series["errors"] += failed
+            series["rows"] += rows
+            series["latency"].observe(seconds)
+            if seconds >= SLOW_QUERY_SECONDS:
+                self.slow_queries.append((datetime.now(), name, seconds, repr(args)[:120]))
+
+    def observe_queue_wait(self, name: str, seconds: float):
+        # Time a deferred command spent queued before a worker picked it up
+        with self._lock:
+            series = self._series(self.queue_waits, name)
+            series["calls"] += 1
+            series["latency"].observe(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, read):
+        # read() is called on every dump, so gauges are never stale
+        self.gauges[name] = read
+
+    def summary(self, table: dict, limit: int = 10) -> list[str]:
+        # One line per series, busiest first, for /stats
+        with self._lock:
+            rows = sorted(table.items(), key=lambda item: item[1]["latency"].sum, reverse=True)[:limit]
+            return [
+                f"{name[:18]:<18} {series['calls']:>6} "
+                f"{series['latency'].quantile(0.5) * 1000:>7.1f} {series['latency'].quantile(0.99) * 1000:>7.1f} "
+                f"{series['errors']:>4}"
+                for name, series in rows
+            ]
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# TYPE moose_uptime_seconds gauge",
+            f"moose_uptime_seconds {time.time() - self.started_at:.0f}",
+        ]
+
+        with self._lock:
+            for metric, label, table in (("moose_command", "command", self.commands),
+                                         ("moose_db", "helper", self.queries),
+                                         ("moose_queue_wait", "command", self.queue_waits)):
+                lines.append(f"# TYPE {metric}_latency_seconds histogram")
+                for name, series in table.items():
+                    histogram = series["latency"]
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{metric}_latency_seconds_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_latency_seconds_sum{{{label}="{name}"}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_latency_seconds_count{{{label}="{name}"}} {histogram.count}')
+
+                if table is self.queue_waits:
+                    continue
+                lines.append(f"# TYPE {metric}_errors_total counter")
+                lines += [f'{metric}_errors_total{{{label}="{name}"}} {series["errors"]}' for name, series in table.items()]
+
+            lines.append("# TYPE moose_db_rows_total counter")
+            lines += [f'moose_db_rows_total{{helper="{name}"}} {series["rows"]}' for name, series in self.queries.items()]
+
+            for name, value in self.counters.items():
+                lines += [f"# TYPE moose_{name}_total counter", f"moose_{name}_total {value}"]
+
+        for name, read in self.gauges.items():
+            lines += [f"# TYPE moose_{name} gauge", f"moose_{name} {read()}"]
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        # Written beside the target and renamed, so a scraper never reads half a file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+    async def serve(self, port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+        # Bare-bones HTTP endpoint for a local Prometheus scraper. Every
+        # request gets the full dump, whatever the path.
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+                body = self.render_prometheus().encode()
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/plain; version=0.0.4\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                             b"Connection: close\r\n\r\n" + body)
+                await writer.drain()
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,297 @@
+import sqlite3
+from datetime import datetime
+
+# Schema history for points.db. The database's PRAGMA user_version records the
+# last step applied; on start every later step runs in its own transaction
+# together with the version bump, so a failed step leaves the file as it was.
+# Never edit a step that has shipped, append a new one instead.
+
+
+def _base_tables(cur: sqlite3.Cursor):
+    # The original schema. IF NOT EXISTS because databases created before
+    # versioning already have these tables at user_version 0.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            discord_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            referrals INTEGER DEFAULT 8
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS point_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS store_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            cost INTEGER NOT NULL,
+            description TEXT NOT NULL
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (item_id) REFERENCES store_items (id)
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
+def _balances(cur: sqlite3.Cursor):
+    # Running total of each user's point_entries, kept in step by every write
+    # to the ledger. next_expiry is the earliest expires_at among those rows so
+    # reads can tell whether the total still includes expired points.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS balances (
+            discord_id TEXT PRIMARY KEY,
+            points INTEGER NOT NULL DEFAULT 0,
+            next_expiry TIMESTAMP
+        )
+    """)
+
+    cur.execute("DELETE FROM balances")
+    cur.execute("""
+        INSERT INTO balances (discord_id, points, next_expiry)
+        SELECT discord_id, SUM(points), MIN(expires_at)
+        FROM point_entries
+        GROUP BY discord_id
+    """)
+
+
+def _indexes(cur: sqlite3.Cursor):
+    # FIFO spends and balance fallbacks: seek to the user, walk in earned_at
+    # order and read expires_at/points straight from the index
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_point_entries_fifo
+        ON point_entries (discord_id, earned_at, expires_at, points)
+    """)
+
+    # Expiry sweep
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_point_entries_expiry
+        ON point_entries (expires_at)
+    """)
+
+    # /removeuseritem: oldest copy of one item for one user
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_inventory_item
+        ON user_inventory (discord_id, item_id, purchased_at)
+    """)
+
+    # /inventory: a user's purchases newest first
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_inventory_history
+        ON user_inventory (discord_id, purchased_at, item_id)
+    """)
+
+    # Item lookups by name from the admin commands
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_store_items_name
+        ON store_items (name)
+    """)
+
+
+def _fifo_index_with_id(cur: sqlite3.Cursor):
+    # Set-based spends order the window by (earned_at, id) so ties have a
+    # stable order; put id in the index so that order needs no sort
+    cur.execute("DROP INDEX IF EXISTS idx_point_entries_fifo")
+    cur.execute("""
+        CREATE INDEX idx_point_entries_fifo
+        ON point_entries (discord_id, earned_at, id, expires_at, points)
+    """)
+
+
+def _tickets(cur: sqlite3.Cursor):
+    # One row per ticket channel. The partial unique index stops a member from
+    # holding two open tickets however the creation requests race.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            channel_id TEXT PRIMARY KEY,
+            discord_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP
+        )
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_open_member
+        ON tickets (discord_id) WHERE status = 'open'
+    """)
+
+
+def _audit_log(cur: sqlite3.Cursor):
+    # Every event is stored before it is posted to the log channel;
+    # delivered_at stays NULL until Discord accepts it
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            kind TEXT NOT NULL,
+            actor_id TEXT,
+            target_id TEXT,
+            amount INTEGER,
+            message TEXT NOT NULL,
+            delivered_at TIMESTAMP
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_audit_log_undelivered
+        ON audit_log (id) WHERE delivered_at IS NULL
+    """)
+
+
+def _grant_buckets(cur: sqlite3.Cursor):
+    # Grants are merged per user and expiry bucket (see storage.GRANT_BUCKET).
+    # Older rows have no bucket until the compaction job folds them in.
+    cur.execute("ALTER TABLE point_entries ADD COLUMN bucket TEXT")
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_point_entries_bucket
+        ON point_entries (discord_id, bucket) WHERE bucket IS NOT NULL
+    """)
+
+    # Lets the compaction job find users with unmerged rows without a scan
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_point_entries_unbucketed
+        ON point_entries (discord_id) WHERE bucket IS NULL
+    """)
+
+
+def _stats_tables(cur: sqlite3.Cursor):
+    # Lifetime totals for the leaderboards, updated in the same transaction
+    # as every grant and purchase. The ledger does not keep spent or expired
+    # rows, so the backfill is a best guess: spent is purchases at today's
+    # prices and earned is that plus the current balance. Expired rows the
+    # sweep hasn't deleted yet are left out of the balance, as swept ones are.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            discord_id TEXT PRIMARY KEY,
+            earned INTEGER NOT NULL DEFAULT 0,
+            spent INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS item_sales (
+            item_id INTEGER PRIMARY KEY,
+            purchases INTEGER NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    cur.execute("""
+        INSERT INTO item_sales (item_id, purchases, points)
+        SELECT i.item_id, COUNT(*), COALESCE(SUM(s.cost), 0)
+        FROM user_inventory i
+        LEFT JOIN store_items s ON s.id = i.item_id
+        GROUP BY i.item_id
+    """)
+
+    cur.execute("""
+        INSERT INTO user_stats (discord_id, earned, spent)
+        SELECT u.discord_id, COALESCE(b.points, 0) - COALESCE(x.expired, 0) + COALESCE(p.spent, 0),
+               COALESCE(p.spent, 0)
+        FROM users u
+        LEFT JOIN balances b ON b.discord_id = u.discord_id
+        LEFT JOIN (
+            SELECT discord_id, SUM(points) AS expired
+            FROM point_entries
+            WHERE expires_at <= ?
+            GROUP BY discord_id
+        ) x ON x.discord_id = u.discord_id
+        LEFT JOIN (
+            SELECT i.discord_id, SUM(s.cost) AS spent
+            FROM user_inventory i
+            JOIN store_items s ON s.id = i.item_id
+            GROUP BY i.discord_id
+        ) p ON p.discord_id = u.discord_id
+    """, (datetime.now(),))
+
+    # Top-N reads walk these in order and stop at the LIMIT
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_earned ON user_stats (earned DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_spent ON user_stats (spent DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_item_sales_purchases ON item_sales (purchases DESC)")
+
+
+def _inventory_keyset_index(cur: sqlite3.Cursor):
+    # /inventory pages by (purchased_at, id); with id ahead of item_id the
+    # index order is the page order, so each page is one range read
+    cur.execute("DROP INDEX IF EXISTS idx_user_inventory_history")
+    cur.execute("""
+        CREATE INDEX idx_user_inventory_history
+        ON user_inventory (discord_id, purchased_at, id, item_id)
+    """)
+
+
+def _export_date_indexes(cur: sqlite3.Cursor):
+    # Date-range exports without a member read these in (date, id) order, so
+    # the range is a seek and the output needs no sort. Rows are written in
+    # roughly date order, so new entries land at the end of each index.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_point_entries_earned ON point_entries (earned_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_inventory_purchased ON user_inventory (purchased_at, id)")
+
+
+MIGRATIONS = [
+    (1, _base_tables),
+    (2, _balances),
+    (3, _indexes),
+    (4, _fifo_index_with_id),
+    (5, _tickets),
+    (6, _audit_log),
+    (7, _grant_buckets),
+    (8, _stats_tables),
+    (9, _inventory_keyset_index),
+    (10, _export_date_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> list[int]:
+    # Returns the versions that were applied
+    current = schema_version(conn)
+    if current > LATEST_VERSION:
+        raise RuntimeError(f"Database schema is version {current} but this bot only knows up to {LATEST_VERSION}")
+
+    applied = []
+    cur = conn.cursor()
+
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            step(cur)
+            cur.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
+        applied.append(version)
+
+    return applied
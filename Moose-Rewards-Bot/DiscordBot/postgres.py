@@ -0,0 +1,899 @@
+import asyncio
+import re
+import time
+from datetime import datetime
+
+import asyncpg
+
+import export
+import storage
+from metrics import Metrics
+from repository import Repository
+from storage import COMPACT_CHUNK_SIZE, INVENTORY_PAGE_SIZE, LEADERBOARD_TTL, READ_WORKERS, SWEEP_CHUNK_SIZE
+
+# PostgreSQL backend, for when several bot processes or a dashboard share one
+# database. Same helpers and statuses as storage.py, written for asyncpg.
+#
+# SQLite serializes every write behind one lock; here each member's users row
+# is the lock instead. Every transaction that changes a member's ledger takes
+# it FOR UPDATE first, so spends, grants and purchases for the same member
+# queue in order while different members run in parallel. The background
+# sweep and compaction claim members with FOR UPDATE SKIP LOCKED: a member in
+# the middle of a purchase is skipped and picked up by a later chunk, so
+# housekeeping never waits on a command (or makes one wait), and two
+# processes running it at once split the members between them.
+
+SCHEMA_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+async def _schema(conn: asyncpg.Connection):
+    # The SQLite schema as of migrations.py step 9. No foreign key from
+    # user_inventory to store_items: deleted items keep their purchases,
+    # exactly as in SQLite where foreign keys are not enforced.
+    await conn.execute("""
+        CREATE TABLE users (
+            discord_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            referrals INTEGER NOT NULL DEFAULT 8
+        );
+
+        CREATE TABLE point_entries (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            discord_id TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            earned_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            bucket TEXT
+        );
+
+        CREATE TABLE balances (
+            discord_id TEXT PRIMARY KEY,
+            points BIGINT NOT NULL DEFAULT 0,
+            next_expiry TIMESTAMP
+        );
+
+        CREATE TABLE store_items (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name TEXT NOT NULL,
+            cost INTEGER NOT NULL,
+            description TEXT NOT NULL
+        );
+
+        CREATE TABLE user_inventory (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            discord_id TEXT NOT NULL,
+            item_id BIGINT NOT NULL,
+            purchased_at TIMESTAMP NOT NULL DEFAULT date_trunc('second', now() AT TIME ZONE 'UTC')
+        );
+
+        CREATE TABLE settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+
+        CREATE TABLE tickets (
+            channel_id TEXT PRIMARY KEY,
+            discord_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            opened_at TIMESTAMP DEFAULT date_trunc('second', now() AT TIME ZONE 'UTC'),
+            closed_at TIMESTAMP
+        );
+
+        CREATE TABLE audit_log (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL,
+            kind TEXT NOT NULL,
+            actor_id TEXT,
+            target_id TEXT,
+            amount INTEGER,
+            message TEXT NOT NULL,
+            delivered_at TIMESTAMP
+        );
+
+        CREATE TABLE user_stats (
+            discord_id TEXT PRIMARY KEY,
+            earned BIGINT NOT NULL DEFAULT 0,
+            spent BIGINT NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE item_sales (
+            item_id BIGINT PRIMARY KEY,
+            purchases INTEGER NOT NULL DEFAULT 0,
+            points BIGINT NOT NULL DEFAULT 0
+        );
+
+        CREATE INDEX idx_point_entries_fifo ON point_entries (discord_id, earned_at, id) INCLUDE (expires_at, points);
+        CREATE INDEX idx_point_entries_expiry ON point_entries (expires_at);
+        CREATE UNIQUE INDEX idx_point_entries_bucket ON point_entries (discord_id, bucket) WHERE bucket IS NOT NULL;
+        CREATE INDEX idx_point_entries_unbucketed ON point_entries (discord_id) WHERE bucket IS NULL;
+        CREATE INDEX idx_user_inventory_item ON user_inventory (discord_id, item_id, purchased_at);
+        CREATE INDEX idx_user_inventory_history ON user_inventory (discord_id, purchased_at, id, item_id);
+        CREATE INDEX idx_store_items_name ON store_items (name);
+        CREATE UNIQUE INDEX idx_tickets_open_member ON tickets (discord_id) WHERE status = 'open';
+        CREATE INDEX idx_audit_log_undelivered ON audit_log (id) WHERE delivered_at IS NULL;
+        CREATE INDEX idx_user_stats_earned ON user_stats (earned DESC);
+        CREATE INDEX idx_user_stats_spent ON user_stats (spent DESC);
+        CREATE INDEX idx_item_sales_purchases ON item_sales (purchases DESC);
+    """)
+
+
+async def _export_date_indexes(conn: asyncpg.Connection):
+    # migrations.py step 10
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_point_entries_earned ON point_entries (earned_at, id);
+        CREATE INDEX IF NOT EXISTS idx_user_inventory_purchased ON user_inventory (purchased_at, id);
+    """)
+
+
+# Schema history for PostgreSQL databases, recorded in schema_version.
+# Same rules as migrations.py: never edit a shipped step, append a new one.
+MIGRATIONS = [
+    (1, _schema),
+    (2, _export_date_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def migrate(conn: asyncpg.Connection, schema: str | None) -> list[int]:
+    # Every step runs under an advisory lock on the schema name, so processes
+    # starting together apply each step once
+    lock_key = schema or "public"
+    applied = []
+
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", lock_key)
+        if schema:
+            await conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+            )
+        """)
+
+    for version, step in MIGRATIONS:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", lock_key)
+            current = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            if version > current:
+                await step(conn)
+                await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", version)
+                applied.append(version)
+
+    return applied
+
+# Plain SQL helpers, mirroring storage.py. Each takes a pooled connection.
+
+GRANT_SQL = """
+    INSERT INTO point_entries (discord_id, points, earned_at, expires_at, bucket)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (discord_id, bucket) WHERE bucket IS NOT NULL DO UPDATE SET
+        points = point_entries.points + excluded.points,
+        earned_at = LEAST(point_entries.earned_at, excluded.earned_at),
+        expires_at = LEAST(point_entries.expires_at, excluded.expires_at)
+"""
+
+ADJUST_BALANCE_SQL = """
+    INSERT INTO balances (discord_id, points, next_expiry)
+    VALUES ($1, $2, (SELECT MIN(expires_at) FROM point_entries WHERE discord_id = $1))
+    ON CONFLICT (discord_id) DO UPDATE SET
+        points = balances.points + excluded.points,
+        next_expiry = excluded.next_expiry
+"""
+
+RECORD_EARNED_SQL = """
+    INSERT INTO user_stats (discord_id, earned) VALUES ($1, $2)
+    ON CONFLICT (discord_id) DO UPDATE SET earned = user_stats.earned + excluded.earned
+"""
+
+def _tuples(rows: list[asyncpg.Record]) -> list[tuple]:
+    return [tuple(row) for row in rows]
+
+async def _lock_member(conn: asyncpg.Connection, discord_id: str) -> bool:
+    # Takes the member's ledger lock; False if they are not registered
+    row = await conn.fetchrow("SELECT 1 FROM users WHERE discord_id = $1 FOR UPDATE", discord_id)
+    return row is not None
+
+async def _lock_members(conn: asyncpg.Connection, discord_ids: list[str]) -> set[str]:
+    # Locks in ID order, so bulk operations cannot deadlock with each other.
+    # Returns the registered IDs.
+    rows = await conn.fetch("""
+        SELECT discord_id FROM users
+        WHERE discord_id = ANY($1::text[])
+        ORDER BY discord_id
+        FOR UPDATE
+    """, sorted(discord_ids))
+    return {row[0] for row in rows}
+
+async def remove_expired_chunk(conn: asyncpg.Connection, limit: int = SWEEP_CHUNK_SIZE) -> int:
+    now = datetime.now()
+
+    async with conn.transaction():
+        rows = await conn.fetch("""
+            WITH claimed AS (
+                SELECT discord_id FROM users
+                WHERE discord_id IN (
+                    SELECT discord_id FROM point_entries
+                    WHERE expires_at <= $1
+                    LIMIT $2
+                )
+                FOR UPDATE SKIP LOCKED
+            )
+            DELETE FROM point_entries
+            WHERE expires_at <= $1
+            AND discord_id IN (SELECT discord_id FROM claimed)
+            RETURNING discord_id, points
+        """, now, limit)
+
+        expired = {}
+        for discord_id, points in rows:
+            expired[discord_id] = expired.get(discord_id, 0) + points
+        await conn.executemany(ADJUST_BALANCE_SQL, [(discord_id, -points) for discord_id, points in expired.items()])
+
+    return len(rows)
+
+async def compact_entries_chunk(conn: asyncpg.Connection, limit: int = COMPACT_CHUNK_SIZE) -> tuple[int, int]:
+    if not storage.GRANT_BUCKET:
+        return 0, 0
+
+    async with conn.transaction():
+        rows = await conn.fetch("""
+            WITH claimed AS (
+                SELECT discord_id FROM users
+                WHERE discord_id IN (
+                    SELECT discord_id FROM point_entries
+                    WHERE bucket IS NULL
+                    LIMIT $1
+                )
+                FOR UPDATE SKIP LOCKED
+            )
+            DELETE FROM point_entries
+            WHERE bucket IS NULL
+            AND discord_id IN (SELECT discord_id FROM claimed)
+            RETURNING discord_id, points, earned_at, expires_at
+        """, limit)
+        if not rows:
+            return 0, 0
+
+        merged = {}
+        for discord_id, points, earned_at, expires_at in rows:
+            key = (discord_id, storage._bucket_key(expires_at))
+            if key in merged:
+                total, first_earned, first_expiry = merged[key]
+                merged[key] = (total + points, min(first_earned, earned_at), min(first_expiry, expires_at))
+            else:
+                merged[key] = (points, earned_at, expires_at)
+
+        await conn.executemany(GRANT_SQL, [
+            (discord_id, points, earned_at, expires_at, bucket)
+            for (discord_id, bucket), (points, earned_at, expires_at) in merged.items()
+        ])
+
+    return len(rows), len(merged)
+
+async def _rebuild_balances(conn: asyncpg.Connection):
+    await conn.execute("DELETE FROM balances")
+    await conn.execute("""
+        INSERT INTO balances (discord_id, points, next_expiry)
+        SELECT discord_id, SUM(points), MIN(expires_at)
+        FROM point_entries
+        GROUP BY discord_id
+    """)
+
+async def reconcile_balances(conn: asyncpg.Connection) -> list[tuple]:
+    async with conn.transaction():
+        # Reads carry on; ledger writes wait until the rebuild commits
+        await conn.execute("LOCK TABLE point_entries, balances IN SHARE ROW EXCLUSIVE MODE")
+        drift = await conn.fetch("""
+            WITH actual AS (
+                SELECT discord_id, SUM(points) AS points
+                FROM point_entries
+                GROUP BY discord_id
+            )
+            SELECT b.discord_id, b.points, COALESCE(a.points, 0)
+            FROM balances b
+            LEFT JOIN actual a ON a.discord_id = b.discord_id
+            WHERE b.points != COALESCE(a.points, 0)
+            UNION ALL
+            SELECT a.discord_id, 0, a.points
+            FROM actual a
+            WHERE a.discord_id NOT IN (SELECT discord_id FROM balances)
+        """)
+        await _rebuild_balances(conn)
+
+    return _tuples(drift)
+
+async def set_setting(conn: asyncpg.Connection, key: str, value: str):
+    await conn.execute("""
+        INSERT INTO settings (key, value)
+        VALUES ($1, $2)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """, key, value)
+
+async def get_settings(conn: asyncpg.Connection) -> dict[str, str]:
+    return dict(_tuples(await conn.fetch("SELECT key, value FROM settings")))
+
+async def is_registered(conn: asyncpg.Connection, discord_id: str) -> bool:
+    return await conn.fetchval("SELECT 1 FROM users WHERE discord_id = $1", discord_id) is not None
+
+async def register_user(conn: asyncpg.Connection, discord_id: str, username: str) -> bool:
+    status = await conn.execute("""
+        INSERT INTO users (discord_id, username) VALUES ($1, $2)
+        ON CONFLICT DO NOTHING
+    """, discord_id, username)
+    return status == "INSERT 0 1"
+
+async def register_referral(conn: asyncpg.Connection, discord_id: str, username: str, referral_id: str,
+                            amount: int) -> str:
+    async with conn.transaction():
+        if await is_registered(conn, discord_id):
+            return "already_registered"
+
+        # Locking the referrer makes the referral count check and decrement one step
+        referrals = await conn.fetchval("SELECT referrals FROM users WHERE discord_id = $1 FOR UPDATE", referral_id)
+        if referrals is None:
+            return "referrer_missing"
+        if referrals == 0:
+            return "no_referrals"
+
+        # Lost a race with another registration of the same member
+        if not await register_user(conn, discord_id, username):
+            return "already_registered"
+        await _grant_points(conn, referral_id, amount)
+        await conn.execute("UPDATE users SET referrals = referrals - 1 WHERE discord_id = $1", referral_id)
+    return "registered"
+
+async def _grant_points(conn: asyncpg.Connection, discord_id: str, amount: int):
+    # Caller holds the member's lock
+    now = datetime.now()
+    expires_at = now + storage.POINT_LIFETIME
+    await conn.execute(GRANT_SQL, discord_id, amount, now, expires_at, storage._bucket_key(expires_at))
+    await conn.execute(ADJUST_BALANCE_SQL, discord_id, amount)
+    await conn.execute(RECORD_EARNED_SQL, discord_id, amount)
+
+async def give_points(conn: asyncpg.Connection, discord_id: str, amount: int) -> bool:
+    async with conn.transaction():
+        if not await _lock_member(conn, discord_id):
+            return False
+
+        await _grant_points(conn, discord_id, amount)
+    return True
+
+async def bulk_give(conn: asyncpg.Connection, grants: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+    now = datetime.now()
+    expires_at = now + storage.POINT_LIFETIME
+    bucket = storage._bucket_key(expires_at)
+
+    async with conn.transaction():
+        registered = await _lock_members(conn, list({discord_id for discord_id, _ in grants}))
+        applied = [(discord_id, amount) for discord_id, amount in grants if discord_id in registered and amount > 0]
+
+        await conn.executemany(GRANT_SQL, [(discord_id, amount, now, expires_at, bucket)
+                                           for discord_id, amount in applied])
+        await conn.executemany(ADJUST_BALANCE_SQL, applied)
+        await conn.executemany(RECORD_EARNED_SQL, applied)
+
+    skipped = sorted({discord_id for discord_id, _ in grants} - registered)
+    return applied, skipped
+
+async def bulk_remove(conn: asyncpg.Connection, removals: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+    async with conn.transaction():
+        registered = await _lock_members(conn, list({discord_id for discord_id, _ in removals}))
+        applied = []
+        for discord_id, amount in removals:
+            if discord_id in registered and amount > 0:
+                applied.append((discord_id, await _consume_points(conn, discord_id, amount, partial=True)))
+
+    skipped = sorted({discord_id for discord_id, _ in removals} - registered)
+    return applied, skipped
+
+async def total_points(conn: asyncpg.Connection, discord_id: str) -> int:
+    now = datetime.now()
+    row = await conn.fetchrow("""
+        SELECT points, next_expiry IS NULL OR next_expiry > $1
+        FROM balances
+        WHERE discord_id = $2
+    """, now, discord_id)
+
+    if row is None:
+        return 0
+    if row[1]:
+        return row[0]
+
+    return await conn.fetchval("""
+        SELECT COALESCE(SUM(points), 0)
+        FROM point_entries
+        WHERE discord_id = $1
+        AND expires_at > $2
+    """, discord_id, now)
+
+async def _consume_points(conn: asyncpg.Connection, discord_id: str, amount: int, partial: bool = False) -> int:
+    # Same FIFO walk as storage._consume_points. Caller holds the member's
+    # lock, so no other transaction can change these entries until commit.
+    now = datetime.now()
+
+    boundary = await conn.fetchrow("""
+        WITH fifo AS (
+            SELECT id, earned_at, SUM(points) OVER (ORDER BY earned_at, id) AS running
+            FROM point_entries
+            WHERE discord_id = $1 AND expires_at > $2
+        )
+        SELECT id, earned_at, running
+        FROM fifo
+        WHERE running >= $3
+        ORDER BY earned_at, id
+        LIMIT 1
+    """, discord_id, now, amount)
+
+    if boundary is None:
+        if not partial:
+            return 0
+        rows = await conn.fetch("""
+            DELETE FROM point_entries
+            WHERE discord_id = $1 AND expires_at > $2
+            RETURNING points
+        """, discord_id, now)
+        consumed = sum(points for (points,) in rows)
+    else:
+        entry_id, earned_at, running = boundary
+        await conn.execute("""
+            DELETE FROM point_entries
+            WHERE discord_id = $1 AND expires_at > $2
+            AND (earned_at, id) < ($3, $4)
+        """, discord_id, now, earned_at, entry_id)
+        if running > amount:
+            await conn.execute("UPDATE point_entries SET points = $1 WHERE id = $2", running - amount, entry_id)
+        else:
+            await conn.execute("DELETE FROM point_entries WHERE id = $1", entry_id)
+        consumed = amount
+
+    if consumed:
+        await conn.execute(ADJUST_BALANCE_SQL, discord_id, -consumed)
+    return consumed
+
+async def spend_points(conn: asyncpg.Connection, discord_id: str, amount: int) -> bool:
+    async with conn.transaction():
+        await _lock_member(conn, discord_id)
+        return await _consume_points(conn, discord_id, amount) == amount
+
+async def remove_points(conn: asyncpg.Connection, discord_id: str, amount: int) -> bool:
+    async with conn.transaction():
+        if not await _lock_member(conn, discord_id):
+            return False
+
+        await _consume_points(conn, discord_id, amount, partial=True)
+    return True
+
+async def purchase(conn: asyncpg.Connection, discord_id: str, item_id: int) -> tuple[str, tuple | None]:
+    async with conn.transaction():
+        item = await conn.fetchrow("SELECT name, cost FROM store_items WHERE id = $1", item_id)
+        if not item:
+            return "no_item", None
+        item = tuple(item)
+
+        await _lock_member(conn, discord_id)
+        if await _consume_points(conn, discord_id, item[1]) != item[1]:
+            return "insufficient", item
+
+        await conn.execute("INSERT INTO user_inventory (discord_id, item_id) VALUES ($1, $2)", discord_id, item_id)
+        await conn.execute("""
+            INSERT INTO user_stats (discord_id, spent) VALUES ($1, $2)
+            ON CONFLICT (discord_id) DO UPDATE SET spent = user_stats.spent + excluded.spent
+        """, discord_id, item[1])
+        await conn.execute("""
+            INSERT INTO item_sales (item_id, purchases, points) VALUES ($1, 1, $2)
+            ON CONFLICT (item_id) DO UPDATE SET
+                purchases = item_sales.purchases + 1,
+                points = item_sales.points + excluded.points
+        """, item_id, item[1])
+    return "bought", item
+
+async def top_earners(conn: asyncpg.Connection, limit: int) -> list[tuple]:
+    return _tuples(await conn.fetch("""
+        SELECT discord_id, earned FROM user_stats
+        WHERE earned > 0
+        ORDER BY earned DESC
+        LIMIT $1
+    """, limit))
+
+async def top_spenders(conn: asyncpg.Connection, limit: int) -> list[tuple]:
+    return _tuples(await conn.fetch("""
+        SELECT discord_id, spent FROM user_stats
+        WHERE spent > 0
+        ORDER BY spent DESC
+        LIMIT $1
+    """, limit))
+
+async def top_items(conn: asyncpg.Connection, limit: int) -> list[tuple]:
+    return _tuples(await conn.fetch("""
+        SELECT COALESCE(i.name, 'Removed item #' || s.item_id), s.purchases, s.points
+        FROM item_sales s
+        LEFT JOIN store_items i ON i.id = s.item_id
+        WHERE s.purchases > 0
+        ORDER BY s.purchases DESC
+        LIMIT $1
+    """, limit))
+
+async def get_store_items(conn: asyncpg.Connection) -> list[tuple]:
+    return _tuples(await conn.fetch("SELECT id, name, cost, description FROM store_items ORDER BY id"))
+
+async def upsert_item(conn: asyncpg.Connection, name: str, cost: int, description: str) -> bool:
+    async with conn.transaction():
+        item_id = await conn.fetchval("SELECT id FROM store_items WHERE name = $1 FOR UPDATE", name)
+
+        if item_id is not None:
+            await conn.execute("UPDATE store_items SET cost = $1, description = $2 WHERE id = $3",
+                               cost, description, item_id)
+        else:
+            await conn.execute("INSERT INTO store_items (name, cost, description) VALUES ($1, $2, $3)",
+                               name, cost, description)
+
+    return item_id is not None
+
+async def delete_item(conn: asyncpg.Connection, name: str) -> bool:
+    return await conn.execute("DELETE FROM store_items WHERE name = $1", name) != "DELETE 0"
+
+async def get_inventory_page(conn: asyncpg.Connection, discord_id: str, cursor: tuple | None = None,
+                             newer: bool = False, limit: int = INVENTORY_PAGE_SIZE) -> list[tuple]:
+    if cursor is None:
+        return _tuples(await conn.fetch("""
+            SELECT i.id, i.purchased_at, s.name, s.description
+            FROM user_inventory i
+            JOIN store_items s ON i.item_id = s.id
+            WHERE i.discord_id = $1
+            ORDER BY i.purchased_at DESC, i.id DESC
+            LIMIT $2
+        """, discord_id, limit))
+
+    if not newer:
+        return _tuples(await conn.fetch("""
+            SELECT i.id, i.purchased_at, s.name, s.description
+            FROM user_inventory i
+            JOIN store_items s ON i.item_id = s.id
+            WHERE i.discord_id = $1 AND (i.purchased_at, i.id) < ($2, $3)
+            ORDER BY i.purchased_at DESC, i.id DESC
+            LIMIT $4
+        """, discord_id, *cursor, limit))
+
+    rows = _tuples(await conn.fetch("""
+        SELECT i.id, i.purchased_at, s.name, s.description
+        FROM user_inventory i
+        JOIN store_items s ON i.item_id = s.id
+        WHERE i.discord_id = $1 AND (i.purchased_at, i.id) > ($2, $3)
+        ORDER BY i.purchased_at ASC, i.id ASC
+        LIMIT $4
+    """, discord_id, *cursor, limit))
+    rows.reverse()
+    return rows
+
+async def get_inventory_summary(conn: asyncpg.Connection, discord_id: str) -> list[tuple]:
+    rows = _tuples(await conn.fetch("""
+        SELECT s.name, COUNT(*), MAX(i.purchased_at)
+        FROM user_inventory i
+        JOIN store_items s ON i.item_id = s.id
+        WHERE i.discord_id = $1
+        GROUP BY i.item_id, s.name
+    """, discord_id))
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows
+
+async def export_rows(conn: asyncpg.Connection, path: str, table: str, fmt: str, discord_id: str | None,
+                      since: datetime | None, until: datetime | None) -> dict:
+    # A server-side cursor inside one read-only snapshot, fetched a batch at
+    # a time; each batch is written out on a thread so the event loop keeps
+    # serving commands while the file compresses
+    sql, params = export.export_query(table, discord_id, since, until, placeholder=lambda n: f"${n}")
+    writer = await asyncio.to_thread(export.ExportWriter, path, fmt, export.EXPORTS[table][0])
+    try:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await conn.cursor(sql, *params)
+            while rows := await cursor.fetch(export.EXPORT_BATCH):
+                await asyncio.to_thread(writer.write, rows)
+    finally:
+        result = await asyncio.to_thread(writer.close)
+    return result
+
+async def remove_user_item(conn: asyncpg.Connection, discord_id: str, item_name: str) -> str:
+    async with conn.transaction():
+        item_id = await conn.fetchval("SELECT id FROM store_items WHERE name = $1", item_name)
+        if item_id is None:
+            return "no_item"
+
+        entry_id = await conn.fetchval("""
+            SELECT id
+            FROM user_inventory
+            WHERE discord_id = $1
+              AND item_id = $2
+            ORDER BY purchased_at ASC, id ASC
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, discord_id, item_id)
+        if entry_id is None:
+            return "not_owned"
+
+        await conn.execute("DELETE FROM user_inventory WHERE id = $1", entry_id)
+    return "removed"
+
+async def get_open_tickets(conn: asyncpg.Connection) -> list[tuple]:
+    return _tuples(await conn.fetch("SELECT channel_id, discord_id FROM tickets WHERE status = 'open'"))
+
+async def open_ticket(conn: asyncpg.Connection, discord_id: str, channel_id: str) -> bool:
+    status = await conn.execute("""
+        INSERT INTO tickets (channel_id, discord_id)
+        VALUES ($1, $2)
+        ON CONFLICT DO NOTHING
+    """, channel_id, discord_id)
+    return status == "INSERT 0 1"
+
+async def close_ticket(conn: asyncpg.Connection, channel_id: str) -> bool:
+    status = await conn.execute("""
+        UPDATE tickets SET status = 'closed', closed_at = $1
+        WHERE channel_id = $2 AND status = 'open'
+    """, datetime.now(), channel_id)
+    return status != "UPDATE 0"
+
+async def add_audit_event(conn: asyncpg.Connection, kind: str, message: str, actor_id: str | None,
+                          target_id: str | None, amount: int | None) -> int:
+    return await conn.fetchval("""
+        INSERT INTO audit_log (created_at, kind, actor_id, target_id, amount, message)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING id
+    """, datetime.now(), kind, actor_id, target_id, amount, message)
+
+async def get_undelivered_audit(conn: asyncpg.Connection, before_id: int, limit: int) -> list[tuple]:
+    return _tuples(await conn.fetch("""
+        SELECT id, message FROM audit_log
+        WHERE delivered_at IS NULL AND id < $1
+        ORDER BY id
+        LIMIT $2
+    """, before_id, limit))
+
+async def next_audit_id(conn: asyncpg.Connection) -> int:
+    return await conn.fetchval("SELECT COALESCE(MAX(id), 0) + 1 FROM audit_log")
+
+async def mark_audit_delivered(conn: asyncpg.Connection, event_ids: list[int]):
+    await conn.execute("UPDATE audit_log SET delivered_at = $1 WHERE id = ANY($2::bigint[])",
+                       datetime.now(), event_ids)
+
+
+class PostgresStorage(Repository):
+    # Repository over an asyncpg pool. asyncpg is non-blocking, so there are no
+    # storage threads: every call borrows a pooled connection on the event
+    # loop. schema puts the tables in their own PostgreSQL schema (one per
+    # guild, see guilds.py); None uses the database's default search_path.
+
+    def __init__(self, dsn: str, schema: str | None = None, pool_size: int = READ_WORKERS + 1,
+                 metrics: Metrics | None = None):
+        if schema is not None and not SCHEMA_NAME.match(schema):
+            raise ValueError(f"Invalid schema name {schema!r}")
+
+        self.dsn = dsn
+        self.schema = schema
+        self.pool_size = pool_size
+        self.metrics = metrics or Metrics()
+        self.pool = None
+        self.last_sweep = None
+        self.last_compaction = None
+        self.last_backup = None
+        self._top = {}
+        self._settings = {}
+        self._checkouts = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    async def _call(self, fn, *args):
+        started = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            waited = time.perf_counter() - started
+            self._checkouts += 1
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+
+            started = time.perf_counter()
+            failed = True
+            result = None
+            try:
+                result = await fn(conn, *args)
+                failed = False
+                return result
+            finally:
+                rows = len(result) if isinstance(result, list) else 0
+                self.metrics.observe_query(fn.__name__, time.perf_counter() - started, rows, failed, args)
+
+    def pool_stats(self) -> dict:
+        return {
+            "open": self.pool.get_size() if self.pool else 0,
+            "idle": self.pool.get_idle_size() if self.pool else 0,
+            "checkouts": self._checkouts,
+            "avg_wait_ms": round(self._wait_time / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 3),
+        }
+
+    async def init(self) -> list[int]:
+        await self._open_pool()
+        async with self.pool.acquire() as conn:
+            applied = await migrate(conn, self.schema)
+        if applied:
+            print(f"[Storage] Applied PostgreSQL schema migrations {applied}" +
+                  (f" to {self.schema}" if self.schema else ""))
+        await self.load_settings()
+        return applied
+
+    async def connect(self) -> int:
+        # Opens the pool without migrating, for tools such as the export CLI
+        # that must leave the schema alone. Returns the schema version found,
+        # 0 if the tables were never created; compare with LATEST_VERSION.
+        await self._open_pool()
+        async with self.pool.acquire() as conn:
+            if await conn.fetchval("SELECT to_regclass('schema_version')") is None:
+                return 0
+            return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+    async def _open_pool(self):
+        settings = {"search_path": f'"{self.schema}"'} if self.schema else None
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size,
+                                              server_settings=settings)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def sweep_expired(self, chunk_size: int = SWEEP_CHUNK_SIZE) -> dict:
+        started = time.perf_counter()
+        rows = chunks = 0
+
+        while True:
+            deleted = await self._call(remove_expired_chunk, chunk_size)
+            rows += deleted
+            chunks += 1
+            if deleted < chunk_size:
+                break
+            await asyncio.sleep(0)
+
+        self.last_sweep = {
+            "rows": rows,
+            "chunks": chunks,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(),
+        }
+        return self.last_sweep
+
+    async def compact_entries(self, chunk_size: int = COMPACT_CHUNK_SIZE) -> dict:
+        started = time.perf_counter()
+        removed = written = chunks = 0
+
+        while True:
+            rows, buckets = await self._call(compact_entries_chunk, chunk_size)
+            if not rows:
+                break
+            removed += rows
+            written += buckets
+            chunks += 1
+            await asyncio.sleep(0)
+
+        self.last_compaction = {
+            "rows": removed,
+            "buckets": written,
+            "chunks": chunks,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(),
+        }
+        return self.last_compaction
+
+    async def reconcile_balances(self) -> list[tuple]:
+        return await self._call(reconcile_balances)
+
+    async def backup(self, directory: str, keep: int) -> None:
+        # Left to pg_dump or the server's own backups
+        return None
+
+    async def export(self, path: str, table: str, fmt: str, discord_id: str | None = None,
+                     since: datetime | None = None, until: datetime | None = None) -> dict:
+        return await self._call(export_rows, path, table, fmt, discord_id, since, until)
+
+    async def load_settings(self):
+        self._settings = await self._call(get_settings)
+
+    async def invalidate_settings(self):
+        self._settings = {}
+        await self.load_settings()
+
+    async def set_setting(self, key: str, value: str):
+        await self._call(set_setting, key, value)
+        self._settings[key] = value
+
+    def get_setting(self, key: str) -> str | None:
+        self.metrics.increment("settings_cache_reads")
+        return self._settings.get(key)
+
+    async def is_registered(self, discord_id: str) -> bool:
+        return await self._call(is_registered, discord_id)
+
+    async def register_user(self, discord_id: str, username: str) -> bool:
+        return await self._call(register_user, discord_id, username)
+
+    async def register_referral(self, discord_id: str, username: str, referral_id: str, amount: int) -> str:
+        return await self._call(register_referral, discord_id, username, referral_id, amount)
+
+    async def give_points(self, discord_id: str, amount: int) -> bool:
+        return await self._call(give_points, discord_id, amount)
+
+    async def bulk_give(self, grants: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        return await self._call(bulk_give, grants)
+
+    async def bulk_remove(self, removals: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        return await self._call(bulk_remove, removals)
+
+    async def total_points(self, discord_id: str) -> int:
+        return await self._call(total_points, discord_id)
+
+    async def spend_points(self, discord_id: str, amount: int) -> bool:
+        return await self._call(spend_points, discord_id, amount)
+
+    async def remove_points(self, discord_id: str, amount: int) -> bool:
+        return await self._call(remove_points, discord_id, amount)
+
+    async def purchase(self, discord_id: str, item_id: int) -> tuple[str, tuple | None]:
+        return await self._call(purchase, discord_id, item_id)
+
+    async def _cached_top(self, fn, limit: int) -> list[tuple]:
+        key = (fn.__name__, limit)
+        cached = self._top.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        result = await self._call(fn, limit)
+        self._top[key] = (time.monotonic() + LEADERBOARD_TTL, result)
+        return result
+
+    async def top_earners(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_earners, limit)
+
+    async def top_spenders(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_spenders, limit)
+
+    async def top_items(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_items, limit)
+
+    async def get_store_items(self) -> list[tuple]:
+        return await self._call(get_store_items)
+
+    async def upsert_item(self, name: str, cost: int, description: str) -> bool:
+        return await self._call(upsert_item, name, cost, description)
+
+    async def delete_item(self, name: str) -> bool:
+        return await self._call(delete_item, name)
+
+    async def get_inventory_page(self, discord_id: str, cursor: tuple | None = None, newer: bool = False,
+                                 limit: int = INVENTORY_PAGE_SIZE) -> list[tuple]:
+        return await self._call(get_inventory_page, discord_id, cursor, newer, limit)
+
+    async def get_inventory_summary(self, discord_id: str) -> list[tuple]:
+        return await self._call(get_inventory_summary, discord_id)
+
+    async def remove_user_item(self, discord_id: str, item_name: str) -> str:
+        return await self._call(remove_user_item, discord_id, item_name)
+
+    async def get_open_tickets(self) -> list[tuple]:
+        return await self._call(get_open_tickets)
+
+    async def open_ticket(self, discord_id: str, channel_id: str) -> bool:
+        return await self._call(open_ticket, discord_id, channel_id)
+
+    async def close_ticket(self, channel_id: str) -> bool:
+        return await self._call(close_ticket, channel_id)
+
+    async def add_audit_event(self, kind: str, message: str, actor_id: str | None = None,
+                              target_id: str | None = None, amount: int | None = None) -> int:
+        return await self._call(add_audit_event, kind, message, actor_id, target_id, amount)
+
+    async def get_undelivered_audit(self, before_id: int, limit: int) -> list[tuple]:
+        return await self._call(get_undelivered_audit, before_id, limit)
+
+    async def next_audit_id(self) -> int:
+        return await self._call(next_audit_id)
+
+    async def mark_audit_delivered(self, event_ids: list[int]):
+        await self._call(mark_audit_delivered, event_ids)
@@ -0,0 +1,225 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from metrics import Metrics
+
+
+class BackendUnavailable(Exception):
+    pass
+
+
+class Repository(ABC):
+    # Everything the bot stores, as the async methods the command handlers,
+    # store, tickets and audit log call. storage.Storage (SQLite, the
+    # default) and postgres.PostgresStorage implement it;
+    # scripts/check_backends.py runs the same checks against both.
+    #
+    # Statuses and shapes are part of the contract: rows come back as plain
+    # tuples, and helpers that can refuse return the same status strings on
+    # every backend. Every method is abstract, so a backend missing one
+    # fails when it is constructed rather than on that command's first call.
+
+    metrics: Metrics
+    last_sweep: dict | None
+    last_compaction: dict | None
+    last_backup: dict | None
+
+    # Lifecycle
+
+    @abstractmethod
+    async def init(self) -> list[int]:
+        # Brings the schema up to date, loads the settings cache and returns
+        # the schema versions applied
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @abstractmethod
+    def pool_stats(self) -> dict:
+        # At least open, checkouts and max_wait_ms, for /stats
+        ...
+
+    @abstractmethod
+    async def backup(self, directory: str, keep: int) -> dict | None:
+        # Snapshots the database into directory without stopping the bot (see
+        # backups.py); None for backends with their own tools, like pg_dump
+        ...
+
+    @abstractmethod
+    async def export(self, path: str, table: str, fmt: str, discord_id: str | None = None,
+                     since: datetime | None = None, until: datetime | None = None) -> dict:
+        # Streams one of export.EXPORTS into a gzipped file at path; returns
+        # at least path, rows and seconds
+        ...
+
+    # Users
+
+    @abstractmethod
+    async def is_registered(self, discord_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def register_user(self, discord_id: str, username: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def register_referral(self, discord_id: str, username: str, referral_id: str, amount: int) -> str:
+        # already_registered, referrer_missing, no_referrals or registered
+        ...
+
+    # Ledger
+
+    @abstractmethod
+    async def give_points(self, discord_id: str, amount: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def bulk_give(self, grants: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        ...
+
+    @abstractmethod
+    async def bulk_remove(self, removals: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        ...
+
+    @abstractmethod
+    async def total_points(self, discord_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def spend_points(self, discord_id: str, amount: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def remove_points(self, discord_id: str, amount: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def sweep_expired(self, chunk_size: int) -> dict:
+        ...
+
+    @abstractmethod
+    async def compact_entries(self, chunk_size: int) -> dict:
+        ...
+
+    @abstractmethod
+    async def reconcile_balances(self) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def top_earners(self, limit: int = 10) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def top_spenders(self, limit: int = 10) -> list[tuple]:
+        ...
+
+    # Store
+
+    @abstractmethod
+    async def get_store_items(self) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def upsert_item(self, name: str, cost: int, description: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete_item(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def purchase(self, discord_id: str, item_id: int) -> tuple[str, tuple | None]:
+        # (no_item | insufficient | bought, (name, cost))
+        ...
+
+    @abstractmethod
+    async def top_items(self, limit: int = 10) -> list[tuple]:
+        ...
+
+    # Inventory
+
+    @abstractmethod
+    async def get_inventory_page(self, discord_id: str, cursor: tuple | None = None, newer: bool = False,
+                                 limit: int = 10) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def get_inventory_summary(self, discord_id: str) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def remove_user_item(self, discord_id: str, item_name: str) -> str:
+        # no_item, not_owned or removed
+        ...
+
+    # Settings; get_setting is served from memory and never awaits
+
+    @abstractmethod
+    async def load_settings(self):
+        ...
+
+    @abstractmethod
+    async def invalidate_settings(self):
+        ...
+
+    @abstractmethod
+    async def set_setting(self, key: str, value: str):
+        ...
+
+    @abstractmethod
+    def get_setting(self, key: str) -> str | None:
+        ...
+
+    # Tickets
+
+    @abstractmethod
+    async def get_open_tickets(self) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def open_ticket(self, discord_id: str, channel_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def close_ticket(self, channel_id: str) -> bool:
+        ...
+
+    # Audit log
+
+    @abstractmethod
+    async def add_audit_event(self, kind: str, message: str, actor_id: str | None = None,
+                              target_id: str | None = None, amount: int | None = None) -> int:
+        ...
+
+    @abstractmethod
+    async def get_undelivered_audit(self, before_id: int, limit: int) -> list[tuple]:
+        ...
+
+    @abstractmethod
+    async def next_audit_id(self) -> int:
+        ...
+
+    @abstractmethod
+    async def mark_audit_delivered(self, event_ids: list[int]):
+        ...
+
+
+def open_repository(database_url: str | None, path: str, metrics: Metrics, workers: int,
+                    schema: str | None = None) -> Repository:
+    # The SQLite file at path unless database_url names a PostgreSQL server;
+    # then schema (if given) keeps this repository's tables apart from others
+    # in the same database. Imported here so asyncpg is only needed when used.
+    if database_url:
+        try:
+            from postgres import PostgresStorage
+        except ImportError as e:
+            if e.name != "asyncpg":
+                raise
+            raise BackendUnavailable("DATABASE_URL is set but asyncpg is not installed; "
+                                     "run pip install -r requirements-postgres.txt") from e
+        return PostgresStorage(database_url, schema=schema, pool_size=workers + 1, metrics=metrics)
+
+    from storage import Storage
+    return Storage(path, read_workers=workers, metrics=metrics)
@@ -0,0 +1,117 @@
+# Measures what an online backup costs the bot: a steady mix of /give and
+# /points runs through the async storage layer for a few seconds on its own,
+# then again while backups of the same database are taken back to back.
+# Reports command latency for both phases, each backup's duration and
+# pages/sec, and restores the last snapshot into a new file to check it.
+#
+#   python -m scripts.bench_backup --users 2000 --grants 50 --seconds 5
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import backups
+import storage
+from storage import Storage
+
+CONCURRENCY = 20
+
+
+def seed(path: str, users: int, grants: int):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in storage.PRAGMAS:
+        conn.execute(pragma)
+    storage.init_db(conn)
+    now = datetime.now()
+    with storage.transaction(conn):
+        conn.executemany("INSERT INTO users (discord_id, username) VALUES (?, ?)",
+                         [(str(n), f"player{n}") for n in range(users)])
+        conn.executemany("""
+            INSERT INTO point_entries (discord_id, points, earned_at, expires_at)
+            VALUES (?, ?, ?, ?)
+        """, [(str(n), random.randint(1, 20), now - timedelta(days=day), now + timedelta(days=150 - day))
+              for n in range(users) for day in range(grants)])
+        storage._rebuild_balances(conn.cursor())
+    conn.close()
+
+
+async def load(db: Storage, users: int, seconds: float) -> list[float]:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            user_id = str(random.randrange(users))
+            started = time.perf_counter()
+            if random.random() < 0.3:
+                await db.give_points(user_id, 5)
+            else:
+                await db.total_points(user_id)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    return latencies
+
+
+def report(label: str, latencies: list[float], seconds: float):
+    ordered = sorted(latencies)
+    print(f"{label:<16} {len(ordered) / seconds:8.0f} ops/s   p50 {statistics.median(ordered) * 1000:6.2f} ms   "
+          f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:6.2f} ms   max {ordered[-1] * 1000:7.2f} ms")
+
+
+async def run(args, tmp: str):
+    path = os.path.join(tmp, "points.db")
+    directory = os.path.join(tmp, "backups")
+    seed(path, args.users, args.grants)
+    print(f"Database: {os.path.getsize(path) // 1024} KB, {args.users} users x {args.grants} grants\n")
+
+    db = Storage(path)
+    await db.init()
+    report("no backup", await load(db, args.users, args.seconds), args.seconds)
+
+    results = []
+
+    async def backup_repeatedly(stop: asyncio.Event):
+        while not stop.is_set():
+            results.append(await db.backup(directory, keep=2))
+            await asyncio.sleep(0.5)
+
+    stop = asyncio.Event()
+    backing_up = asyncio.create_task(backup_repeatedly(stop))
+    latencies = await load(db, args.users, args.seconds)
+    stop.set()
+    await backing_up
+    report("during backups", latencies, args.seconds)
+
+    print()
+    for result in results:
+        print(backups.describe(result))
+    await db.close()
+
+    expected = sqlite3.connect(path).execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    restored_path = os.path.join(tmp, "restored.db")
+    restored = backups.restore(results[-1]["file"], restored_path, directory)
+    users = sqlite3.connect(restored_path).execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    print(f"\nRestored {restored['pages']} pages in {restored['seconds']}s: "
+          f"{users} users ({'ok' if users == expected else f'expected {expected}'})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--grants", type=int, default=50, help="ledger rows per user")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
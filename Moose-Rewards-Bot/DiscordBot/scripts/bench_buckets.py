@@ -0,0 +1,104 @@
+# Builds a synthetic ledger of one grant per row (how every grant was stored
+# before bucketing), measures spend latency, folds it into day buckets with
+# the compaction job and measures again.
+#
+#   python -m scripts.bench_buckets --users 1000 --grants 1000
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import storage
+
+SPEND_SAMPLES = 200
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in storage.PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def seed(conn: sqlite3.Connection, users: int, grants: int):
+    # grants per user, spread over the last 179 days so nothing has expired
+    storage.init_db(conn)
+    now = datetime.now()
+    span = (storage.POINT_LIFETIME - timedelta(days=1)).total_seconds()
+
+    with storage.transaction(conn):
+        conn.executemany("INSERT INTO users (discord_id, username) VALUES (?, ?)",
+                         [(str(n), f"player{n}") for n in range(users)])
+        for n in range(users):
+            rows = []
+            for _ in range(grants):
+                earned_at = now - timedelta(seconds=random.uniform(0, span))
+                rows.append((str(n), random.randint(1, 20), earned_at, earned_at + storage.POINT_LIFETIME))
+            conn.executemany("""
+                INSERT INTO point_entries (discord_id, points, earned_at, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+        storage._rebuild_balances(conn.cursor())
+    conn.execute("ANALYZE")
+
+
+def row_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM point_entries").fetchone()[0]
+
+
+def measure_spends(conn: sqlite3.Connection, user_ids: list[str]) -> list[float]:
+    # Each user spends half their balance, so the FIFO walk crosses half their rows
+    latencies = []
+    for user_id in user_ids:
+        amount = storage.total_points(conn, user_id) // 2
+        started = time.perf_counter()
+        assert storage.spend_points(conn, user_id, amount)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(label: str, rows: int, latencies: list[float]):
+    ordered = sorted(latencies)
+    print(f"{label:<8} {rows:>10} rows   spend p50 {statistics.median(ordered) * 1000:7.2f} ms   "
+          f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--grants", type=int, default=1000, help="grants per user")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect(os.path.join(tmp, "buckets.db"))
+
+        started = time.perf_counter()
+        seed(conn, args.users, args.grants)
+        print(f"seeded {row_count(conn)} entries in {time.perf_counter() - started:.1f}s")
+
+        sampled = random.sample(range(args.users), min(args.users, SPEND_SAMPLES * 2))
+        before_ids, after_ids = [str(n) for n in sampled[::2]], [str(n) for n in sampled[1::2]]
+
+        report("before", row_count(conn), measure_spends(conn, before_ids))
+
+        started = time.perf_counter()
+        chunks = 0
+        while storage.compact_entries_chunk(conn)[0]:
+            chunks += 1
+        print(f"compacted in {chunks} chunks, {time.perf_counter() - started:.1f}s")
+        conn.execute("ANALYZE")
+
+        report("after", row_count(conn), measure_spends(conn, after_ids))
+
+        drift = storage.reconcile_balances(conn)
+        print(f"balance drift after run: {len(drift)} users")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Compares granting and removing points for many members one command at a
+# time against the single-transaction bulk path.
+#
+#   python -m scripts.bench_bulk --members 2000
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import storage
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in storage.PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def seed(conn: sqlite3.Connection, members: int) -> list[str]:
+    storage.init_db(conn)
+    ids = [str(100000 + n) for n in range(members)]
+    with storage.transaction(conn):
+        conn.executemany("INSERT INTO users (discord_id, username) VALUES (?, ?)",
+                         [(discord_id, f"player{discord_id}") for discord_id in ids])
+    return ids
+
+
+def timed(label: str, fn) -> float:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--amount", type=int, default=25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect(os.path.join(tmp, "bulk.db"))
+        ids = seed(conn, args.members)
+        # A few unregistered IDs, like a real export would have
+        targets = [(discord_id, args.amount) for discord_id in ids] + [(str(n), args.amount) for n in range(10)]
+        random.shuffle(targets)
+
+        single = timed("give one at a time", lambda: [
+            storage.give_points(conn, discord_id, amount) for discord_id, amount in targets])
+        bulk = timed("give in bulk", lambda: storage.bulk_give(conn, targets))
+        print(f"{'':<28} {single / bulk:9.1f}x faster")
+
+        single = timed("remove one at a time", lambda: [
+            storage.remove_points(conn, discord_id, amount) for discord_id, amount in targets])
+        bulk = timed("remove in bulk", lambda: storage.bulk_remove(conn, targets))
+        print(f"{'':<28} {single / bulk:9.1f}x faster")
+
+        drift = storage.reconcile_balances(conn)
+        print(f"balance drift after run: {len(drift)} users")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Exports a synthetic multi-million-row ledger and checks the export stays
+# under a fixed memory ceiling. Each export runs in its own process so its
+# peak RSS is its own; --compare also runs the old fetchall() approach.
+#
+#   python -m scripts.bench_export --rows 3000000 --max-rss-mb 64 --compare
+
+import argparse
+import gzip
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import export
+import storage
+
+USERS = 20000
+SEED_BATCH = 100000
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(path: str, rows: int):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in storage.PRAGMAS:
+        conn.execute(pragma)
+    storage.init_db(conn)
+    start = datetime.now() - timedelta(days=179)
+
+    def entries(first: int, count: int):
+        for n in range(first, first + count):
+            earned_at = start + timedelta(seconds=n * 5)
+            yield str(n % USERS), random.randint(1, 20), earned_at, earned_at + storage.POINT_LIFETIME
+
+    with storage.transaction(conn):
+        for first in range(0, rows, SEED_BATCH):
+            conn.executemany("""
+                INSERT INTO point_entries (discord_id, points, earned_at, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, entries(first, min(SEED_BATCH, rows - first)))
+    conn.close()
+
+
+def fetchall_export(db_path: str, path: str, fmt: str) -> dict:
+    # What an ad-hoc dump did before: every row in memory, then written
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    sql, params = export.export_query("ledger")
+    rows = conn.execute(sql, params).fetchall()
+    writer = export.ExportWriter(path, fmt, export.EXPORTS["ledger"][0])
+    writer.write(rows)
+    writer.close()
+    conn.close()
+    return {"rows": len(rows), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def child(args):
+    baseline = peak_rss_mb()
+    path = os.path.join(os.path.dirname(args.db), f"ledger.{args.format}.gz")
+    if args.child == "stream":
+        result = export.export_sqlite(args.db, path, "ledger", args.format)
+    else:
+        result = fetchall_export(args.db, path, args.format)
+    print(f"{args.child:<9} {result['rows']:>10} rows {result['seconds']:>8.2f}s "
+          f"{result['rows'] / result['seconds']:>10.0f} rows/s {os.path.getsize(path) / 1024 / 1024:>8.1f} MB gz "
+          f"peak RSS {peak_rss_mb():>7.1f} MB (+{peak_rss_mb() - baseline:.1f})")
+    return 0 if args.child != "stream" or peak_rss_mb() <= args.max_rss_mb else 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3000000)
+    parser.add_argument("--format", choices=export.FORMATS, default="csv")
+    parser.add_argument("--max-rss-mb", type=float, default=64, help="fail if the streaming export peaks above this")
+    parser.add_argument("--compare", action="store_true", help="also run a fetchall() export")
+    parser.add_argument("--child", choices=("stream", "fetchall"), help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "ledger.db")
+        started = time.perf_counter()
+        seed(db_path, args.rows)
+        print(f"Seeded {args.rows} ledger rows ({os.path.getsize(db_path) // 1024 // 1024} MB) "
+              f"in {time.perf_counter() - started:.1f}s\n")
+
+        failed = False
+        for mode in ("stream", "fetchall") if args.compare else ("stream",):
+            status = subprocess.run([sys.executable, "-m", "scripts.bench_export", "--child", mode, "--db", db_path,
+                                     "--format", args.format, "--max-rss-mb", str(args.max_rss_mb)]).returncode
+            failed = failed or status != 0
+
+        with gzip.open(os.path.join(tmp, f"ledger.{args.format}.gz"), "rt") as f:
+            lines = sum(1 for _ in f)
+        print(f"\nLast file: {lines} lines")
+
+    print(f"Streaming export {'went over' if failed else 'stayed within'} {args.max_rss_mb:g} MB")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# Compares the default gateway settings with LOW_MEMORY against a synthetic
+# guild fixture, without connecting to Discord: READY and GUILD_CREATE
+# payloads for large guilds are fed straight into discord.py's connection
+# state, and member chunk requests are answered by a fake websocket with
+# GUILD_MEMBERS_CHUNK payloads of up to 1000 members, as Discord sends them.
+# Each mode runs in its own process and reports resident memory and time
+# from READY to on_ready, after a stream of interactions from --interactors
+# distinct members.
+#
+# Each guild also has --tickets legacy ticket- channels whose owner is only
+# named in a permission overwrite. They are adopted through TicketRegistry
+# the way on_ready does it, twice to stand in for a reconnect. In low-memory
+# mode those owners aren't cached, so each one costs a member fetch, answered
+# here by a fake REST call; in default mode they come from the chunks. The run fails if any ticket isn't adopted or if
+# the second pass fetches again.
+#
+#   python -m scripts.bench_gateway --guilds 4 --members 50000 --interactors 2000
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CHUNK_SIZE = 1000
+BOT_ID = 1
+CHANNELS = 60
+ROLES = 30
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def member_payload(guild_id: int, member_id: int) -> dict:
+    return {
+        "user": {"id": str(member_id), "username": f"member{member_id}", "global_name": f"Member {member_id}",
+                 "discriminator": "0", "avatar": None, "bot": member_id == BOT_ID},
+        "roles": [str(guild_id * 1000 + 1 + member_id % ROLES)],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "nick": None, "deaf": False, "mute": False, "flags": 0,
+    }
+
+
+def ticket_owner(guild_id: int, members: int, n: int) -> int:
+    # From the end of the member list, so no interactor owns a ticket
+    return guild_id * 10_000_000 + members - 1 - n
+
+
+def category_id(guild_id: int) -> int:
+    return guild_id * 1000 + 499
+
+
+def guild_payload(guild_id: int, members: int, tickets: int) -> dict:
+    # What Discord sends for a large guild: channels, roles and only the
+    # bot's own member; the rest arrive in chunks if requested
+    roles = [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0,
+              "color": 0, "hoist": False, "managed": False, "mentionable": False}]
+    roles += [{"id": str(guild_id * 1000 + n), "name": f"role-{n}", "permissions": "0", "position": n,
+               "color": 0, "hoist": False, "managed": False, "mentionable": False} for n in range(1, ROLES + 1)]
+    channels = [{"id": str(guild_id * 1000 + 500 + n), "type": 0, "name": f"channel-{n}", "position": n,
+                 "permission_overwrites": []} for n in range(CHANNELS)]
+    channels.append({"id": str(category_id(guild_id)), "type": 4, "name": "tickets", "position": CHANNELS,
+                     "permission_overwrites": []})
+    # Overwrite type 0 is a role, 1 a member
+    channels += [{"id": str(guild_id * 1000 + 600 + n), "type": 0, "name": f"ticket-{n}", "position": n,
+                  "parent_id": str(category_id(guild_id)),
+                  "permission_overwrites": [
+                      {"id": str(guild_id), "type": 0, "allow": "0", "deny": "1024"},
+                      {"id": str(ticket_owner(guild_id, members, n)), "type": 1, "allow": "1024", "deny": "0"},
+                  ]} for n in range(tickets)]
+    return {
+        "id": str(guild_id), "name": f"Guild {guild_id}", "owner_id": "2", "large": True,
+        "member_count": members, "roles": roles, "channels": channels, "emojis": [], "stickers": [],
+        "features": [], "threads": [], "voice_states": [], "presences": [],
+        "members": [member_payload(guild_id, BOT_ID)],
+    }
+
+
+class FakeWebSocket:
+    # Answers request_chunks the way the gateway does, one event per chunk
+    def __init__(self, state, members: int):
+        self.state = state
+        self.members = members
+        self.requests = 0
+
+    async def request_chunks(self, guild_id: int, query=None, *, limit: int, user_ids=None,
+                             presences: bool = False, nonce=None):
+        self.requests += 1
+        asyncio.create_task(self._send_chunks(guild_id, nonce))
+
+    async def _send_chunks(self, guild_id: int, nonce):
+        count = -(-self.members // CHUNK_SIZE)
+        for index in range(count):
+            first = guild_id * 10_000_000 + index * CHUNK_SIZE
+            self.state.parse_guild_members_chunk({
+                "guild_id": str(guild_id), "nonce": nonce, "chunk_index": index, "chunk_count": count,
+                "members": [member_payload(guild_id, member_id)
+                            for member_id in range(first, first + min(CHUNK_SIZE, self.members - index * CHUNK_SIZE))],
+            })
+            await asyncio.sleep(0)
+
+
+async def run_mode(low_memory: bool, args) -> dict:
+    import discord
+    from discord.member import Member
+
+    from gateway import MemberCache, client_options
+
+    options = client_options(low_memory)
+    client = discord.Client(guild_ready_timeout=args.ready_timeout, **options)
+    await client._async_setup_hook()  # What login() does before connecting
+    state = client._connection
+    ws = FakeWebSocket(state, args.members)
+    state._get_websocket = lambda *_, **__: ws
+    member_cache = MemberCache()
+    ready = asyncio.Event()
+
+    @client.event
+    async def on_ready():
+        ready.set()
+
+    gc.collect()
+    baseline = rss_mb()
+    guild_ids = [100 + n for n in range(args.guilds)]
+
+    started = time.perf_counter()
+    state.parse_ready({
+        "v": 10, "user": {"id": str(BOT_ID), "username": "bot", "discriminator": "0", "avatar": None, "bot": True},
+        "guilds": [{"id": str(guild_id), "unavailable": True} for guild_id in guild_ids],
+        "session_id": "bench", "application": {"id": str(BOT_ID), "flags": 0},
+    })
+    for guild_id in guild_ids:
+        state.parse_guild_create(guild_payload(guild_id, args.members, args.tickets))
+    await ready.wait()
+    time_to_ready = time.perf_counter() - started
+
+    # Interactions carry their member; main remembers each one
+    for n in range(args.interactors):
+        guild = client.get_guild(guild_ids[n % len(guild_ids)])
+        member_id = guild.id * 10_000_000 + n
+        member_cache.remember(Member(data=member_payload(guild.id, member_id), guild=guild, state=state))
+
+    gc.collect()
+    result = {
+        "mode": "low-memory" if low_memory else "default",
+        "intents": options["intents"].value,
+        "time_to_ready_s": round(time_to_ready - args.ready_timeout, 3),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_growth_mb": round(rss_mb() - baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "members_cached": sum(len(guild.members) for guild in client.guilds) + len(member_cache),
+        "chunk_requests": ws.requests,
+    }
+    result.update(await adopt_tickets(client, member_cache, guild_ids, args.members, args.tickets))
+    return result
+
+
+async def adopt_tickets(client, member_cache, guild_ids: list[int], members: int, tickets: int) -> dict:
+    from storage import Storage
+    from tickets import TicketRegistry
+
+    fetches = []
+
+    async def get_member(guild_id: int, member_id: int) -> dict:
+        fetches.append(member_id)
+        return member_payload(int(guild_id), int(member_id))
+
+    client.http.get_member = get_member
+    adopted = refetched = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Storage(os.path.join(tmp, "tickets.db"))
+        await db.init()
+        for guild_id in guild_ids:
+            guild = client.get_guild(guild_id)
+            registry = TicketRegistry(db)
+            await registry.load(guild, category_id(guild_id), member_cache)
+            first_pass = len(fetches)
+            await registry.load(guild, category_id(guild_id), member_cache)
+            refetched += len(fetches) - first_pass
+            adopted += sum(registry.channel_for(ticket_owner(guild_id, members, n)) is not None for n in range(tickets))
+        await db.close()
+
+    return {"tickets_adopted": adopted, "ticket_fetches": len(fetches), "ticket_refetches": refetched}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=4)
+    parser.add_argument("--members", type=int, default=50000, help="members per guild")
+    parser.add_argument("--interactors", type=int, default=2000, help="distinct members using commands")
+    parser.add_argument("--tickets", type=int, default=5, help="legacy ticket channels per guild")
+    parser.add_argument("--ready-timeout", type=float, default=0.1,
+                        help="discord.py's wait for further GUILD_CREATEs, left out of time to ready")
+    parser.add_argument("--mode", choices=("default", "low-memory"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode == "low-memory", args))))
+        return 0
+
+    print(f"{args.guilds} guilds x {args.members} members, {args.interactors} interactors\n")
+    print(f"{'mode':<12} {'ready s':>8} {'RSS MB':>8} {'growth':>8} {'peak':>8} {'cached':>9} {'chunks':>7} "
+          f"{'tickets':>8} {'fetches':>8}")
+    results = []
+    for mode in ("default", "low-memory"):
+        output = subprocess.run([sys.executable, "-m", "scripts.bench_gateway", "--mode", mode] + sys.argv[1:],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        results.append(result)
+        print(f"{result['mode']:<12} {result['time_to_ready_s']:>8} {result['rss_mb']:>8} "
+              f"{result['rss_growth_mb']:>8} {result['peak_rss_mb']:>8} {result['members_cached']:>9} "
+              f"{result['chunk_requests']:>7} {result['tickets_adopted']:>8} {result['ticket_fetches']:>8}")
+
+    default, lean = results
+    print(f"\nLow-memory mode: {default['rss_growth_mb'] - lean['rss_growth_mb']:.1f} MB less growth, "
+          f"ready {default['time_to_ready_s'] - lean['time_to_ready_s']:.3f}s sooner")
+
+    expected = args.guilds * args.tickets
+    failed = [result for result in results if result["tickets_adopted"] != expected or result["ticket_refetches"]]
+    for result in failed:
+        print(f"FAIL: {result['mode']} adopted {result['tickets_adopted']} of {expected} legacy tickets, "
+              f"{result['ticket_refetches']} members fetched again on the second load")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
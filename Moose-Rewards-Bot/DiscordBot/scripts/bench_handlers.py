@@ -0,0 +1,114 @@
+# Fires N concurrent simulated interactions at a temp database and reports
+# handler latency and event loop stalls, once with the old blocking sqlite3
+# calls and once through the async Storage layer.
+#
+#   python -m scripts.bench_handlers --interactions 500 --users 200
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import storage
+from storage import Storage
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed(path: str, users: int):
+    conn = sqlite3.connect(path)
+    storage.init_db(conn)
+    for n in range(users):
+        storage.register_user(conn, str(n), f"player{n}")
+        storage.give_points(conn, str(n), 100)
+    conn.close()
+
+
+def blocking(path: str, fn, *args):
+    # What the handlers used to do: connect, query and commit on the event loop
+    conn = sqlite3.connect(path)
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+
+async def simulated_interaction(read, write, user_id: str):
+    # /points for most users, /give for the rest, like a busy evening
+    if random.random() < 0.7:
+        if await read(storage.is_registered, user_id):
+            await read(storage.total_points, user_id)
+    else:
+        await write(storage.give_points, user_id, 5)
+
+
+async def heartbeat(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    # Stand-in for the gateway heartbeat: how late does a 10ms timer fire?
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def run_case(read, write, interactions: int, users: int) -> tuple[list[float], list[float]]:
+    latencies = []
+    lag = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lag, stop))
+
+    # Every interaction arrives at once, so latency includes time spent queued
+    # behind other handlers, which is what users actually see
+    arrived = time.perf_counter()
+
+    async def timed(user_id: str):
+        await simulated_interaction(read, write, user_id)
+        latencies.append(time.perf_counter() - arrived)
+
+    await asyncio.gather(*(timed(str(random.randrange(users))) for _ in range(interactions)))
+    stop.set()
+    await beat
+    return latencies, lag
+
+
+def report(label: str, latencies: list[float], lag: list[float], elapsed: float):
+    print(f"{label:<10} p50 {percentile(latencies, 50) * 1000:8.2f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:8.2f} ms   "
+          f"max loop lag {max(lag or [0]) * 1000:8.2f} ms   "
+          f"{len(latencies) / elapsed:8.0f} interactions/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--interactions", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.users)
+
+        async def run_blocking(fn, *fn_args):
+            return blocking(path, fn, *fn_args)
+
+        started = time.perf_counter()
+        latencies, lag = await run_case(run_blocking, run_blocking, args.interactions, args.users)
+        report("before", latencies, lag, time.perf_counter() - started)
+
+        db = Storage(path)
+
+        started = time.perf_counter()
+        latencies, lag = await run_case(db._read, db._run, args.interactions, args.users)
+        report("after", latencies, lag, time.perf_counter() - started)
+        print(f"pool: {db.pool_stats()}")
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
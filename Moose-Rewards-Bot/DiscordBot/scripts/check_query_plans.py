@@ -0,0 +1,134 @@
+# Runs every hot storage helper against a seeded temp database, captures the
+# SQL it actually executes and fails if any statement's EXPLAIN QUERY PLAN
+# falls back to a full table scan or a temp B-tree sort. Filtered exports are
+# checked the same way; an unfiltered export reads the whole table anyway.
+#
+#   python -m scripts.check_query_plans
+
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import export
+import storage
+
+# Helpers called on every command or button press, with the arguments to use
+HOT_PATHS = [
+    ("is_registered", ("1",)),
+    ("get_setting", ("ticket_prompt_message_id",)),
+    ("total_points", ("1",)),
+    ("give_points", ("1", 10)),
+    ("spend_points", ("1", 15)),
+    ("purchase", ("1", 1)),
+    ("remove_points", ("1", 1000)),
+    ("get_inventory_page", ("1",)),
+    ("get_inventory_page", ("1", ("2000-01-01 00:00:00", 1))),
+    ("get_inventory_page", ("1", ("2000-01-01 00:00:00", 1), True)),
+    ("get_inventory_summary", ("1",)),
+    ("remove_user_item", ("1", "Item 1")),
+    ("upsert_item", ("Item 1", 5, "Updated")),
+    ("remove_expired_chunk", ()),
+    ("compact_entries_chunk", ()),
+    ("top_earners", (10,)),
+    ("top_spenders", (10,)),
+    ("top_items", (10,)),
+]
+
+# Filtered exports, as export_query arguments
+SINCE = datetime(2000, 1, 1)
+EXPORT_QUERIES = [
+    (table, filters)
+    for table in ("ledger", "inventory")
+    for filters in ({"discord_id": "1"}, {"since": SINCE}, {"since": SINCE, "until": datetime(2100, 1, 1)},
+                    {"discord_id": "1", "since": SINCE})
+] + [("users", {"discord_id": "1"})]
+
+SKIP_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA")
+
+
+def seed(conn: sqlite3.Connection):
+    storage.init_db(conn)
+    now = datetime.now()
+    for n in range(50):
+        storage.register_user(conn, str(n), f"player{n}")
+        storage.upsert_item(conn, f"Item {n}", n + 1, "Seed item")
+        # Grants spread over past days, so each user has several bucket rows
+        for days in range(5):
+            earned_at = now - timedelta(days=days)
+            expires_at = earned_at + storage.POINT_LIFETIME
+            conn.execute(storage.GRANT_SQL, (str(n), 20, earned_at, expires_at, storage._bucket_key(expires_at)))
+    storage.reconcile_balances(conn)
+    for n in range(50):
+        storage.purchase(conn, str(n), 1)
+    # Pre-bucket grants for the compaction job to fold in
+    conn.execute("UPDATE point_entries SET bucket = NULL WHERE discord_id IN ('1', '2', '3')")
+    conn.execute("ANALYZE")
+
+
+def bad_plan(plan: list[tuple], partial_indexes: set[str] = frozenset()) -> list[str]:
+    # plan is EXPLAIN QUERY PLAN's (id, parent, notused, detail) rows.
+    # A SEARCH is an index seek; a SCAN walks the whole table or index.
+    # Scanning a CTE or subquery's own output is fine, it is already filtered,
+    # and so is scanning a partial index, which only holds matching rows. For
+    # the same reason a sort is fine when the outer query reads only CTE or
+    # subquery output.
+    details = [row[3] for row in plan]
+    derived = {detail.split()[-1] for detail in details if detail.startswith(("CO-ROUTINE", "MATERIALIZE"))}
+    outer = [detail.split()[1] for _, parent, _, detail in plan if parent == 0 and detail.startswith(("SCAN", "SEARCH"))]
+    sorts_derived = bool(outer) and all(source.startswith("(") or source in derived for source in outer)
+    problems = []
+    for detail in details:
+        if "TEMP B-TREE" in detail and not sorts_derived:
+            problems.append(detail)
+        if not detail.startswith("SCAN") or "CONSTANT ROW" in detail:
+            continue
+        source = detail.split()[1]
+        if not (source.startswith("(") or source in derived or detail.split()[-1] in partial_indexes):
+            problems.append(detail)
+    return problems
+
+
+def check(conn: sqlite3.Connection, name: str, sql: str, params, partial_indexes: set[str]) -> bool:
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    plan = [row[3] for row in rows]
+    problems = bad_plan(rows, partial_indexes)
+    print(f"[{'FAIL' if problems else 'ok'}] {name}: {' '.join(sql.split())[:100]}")
+    for detail in (problems if problems else plan):
+        print(f"        {detail}")
+    return bool(problems)
+
+
+def main() -> int:
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "plans.db"), isolation_level=None)
+        seed(conn)
+        partial_indexes = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+
+        for name, args in HOT_PATHS:
+            statements = []
+            conn.set_trace_callback(statements.append)
+            getattr(storage, name)(conn, *args)
+            conn.set_trace_callback(None)
+
+            for sql in statements:
+                if sql.lstrip().upper().startswith(SKIP_PREFIXES):
+                    continue
+                failures += check(conn, name, sql, (), partial_indexes)
+
+        for table, filters in EXPORT_QUERIES:
+            sql, params = export.export_query(table, **filters)
+            failures += check(conn, f"export {table} by {', '.join(filters)}", sql, params, partial_indexes)
+
+        conn.close()
+
+    print(f"\n{failures} statement(s) with a full scan or temp sort")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# Stand-ins for the parts of discord.py the command handlers touch, so they
+# can be driven without a gateway connection:
+#
+#   interaction = FakeInteraction(member)
+#   await main.points.callback(interaction)
+#   interaction.replies  # [(content, embed), ...]
+#
+# Only what the handlers actually use is implemented; anything else raises
+# AttributeError, which is the point: a handler reaching for something new
+# shows up here first.
+
+import itertools
+import time
+
+import discord
+
+_ids = itertools.count(10_000_000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeRole:
+    def __init__(self, name: str, role_id: int | None = None):
+        self.id = role_id or next_id()
+        self.name = name
+        self.members = []
+        self.mention = f"<@&{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", name: str, channel_id: int | None = None):
+        self.id = channel_id or next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+        self.sent = []
+
+    async def send(self, content: str | None = None, **kwargs):
+        self.sent.append((content, kwargs.get("embed")))
+
+    async def delete(self, reason: str | None = None):
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", name: str, member_id: int | None = None, bot: bool = False):
+        self.id = member_id or next_id()
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.guild = guild
+        self.bot = bot
+        self.roles = []
+
+    def add_role(self, role: FakeRole):
+        self.roles.append(role)
+        role.members.append(self)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int | None = None):
+        self.id = guild_id or next_id()
+        self.members = {}
+        self.channels = {}
+        self.roles = [FakeRole("@everyone", self.id)]
+        self.default_role = self.roles[0]
+        self.filesize_limit = 10 * 1024 * 1024  # Discord's upload limit without boosts
+
+    def add_member(self, name: str, member_id: int | None = None) -> FakeMember:
+        member = FakeMember(self, name, member_id)
+        self.members[member.id] = member
+        return member
+
+    def add_role(self, name: str) -> FakeRole:
+        role = FakeRole(name)
+        self.roles.append(role)
+        return role
+
+    def add_channel(self, name: str) -> FakeChannel:
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_member(self, member_id: int) -> FakeMember | None:
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channels.get(channel_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        self._interaction.responded_at = time.perf_counter()
+
+    async def send_message(self, content: str | None = None, *, embed: discord.Embed | None = None, **kwargs):
+        self._respond()
+        self._interaction.replies.append((content, embed))
+
+    async def edit_message(self, *, content: str | None = None, embed: discord.Embed | None = None, **kwargs):
+        self._respond()
+        self._interaction.replies.append((content, embed))
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False):
+        self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content: str | None = None, *, embed: discord.Embed | None = None, **kwargs):
+        if not self._interaction.response.is_done():
+            raise RuntimeError("followup.send before the interaction was responded to")
+        self._interaction.replies.append((content, embed))
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, channel: FakeChannel | None = None):
+        self.id = next_id()
+        self.user = user
+        self.guild = user.guild
+        self.guild_id = user.guild.id
+        self.channel = channel
+        self.command = None
+        self.extras = {}
+        self.replies = []
+        self.created_at = time.perf_counter()
+        self.responded_at = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    @property
+    def reply(self) -> str | None:
+        # Text of the first reply, or the embed description
+        if not self.replies:
+            return None
+        content, embed = self.replies[0]
+        return content if content is not None else embed.description
@@ -0,0 +1,210 @@
+# Drives the real command handlers from main.py with fake interactions
+# against temp databases: thousands of members spread over one or more
+# guilds register (half of them through referrals), then a mixed load of
+# /points, /store, store purchases and admin /give runs concurrently.
+# Reports throughput and tail latency per operation, and how long
+# interactions waited to be acknowledged (Discord's limit is 3 seconds).
+#
+#   python -m scripts.load_test --users 2000 --operations 20000 --concurrency 200 --guilds 4
+#
+# DATABASE_URL from the shell or .env is ignored, so the run never writes to
+# the bot's real database. --postgres runs it against PostgreSQL instead, in
+# a throwaway schema (and one per extra guild) dropped afterwards.
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ITEMS = [("Sword", 40, "A sharp sword"), ("Shield", 75, "A sturdy shield"),
+         ("Potion", 10, "Heals a little"), ("Elytra", 500, "Fly away")]
+MIX = [("points", 50), ("store", 20), ("buy", 20), ("give", 10)]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def run(self, name: str, call, limit: asyncio.Semaphore):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await call
+            except Exception as e:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                if self.errors[name] == 1:
+                    print(f"{name} failed: {e!r}")
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    def report(self, elapsed: float):
+        print(f"{'operation':<10} {'count':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'max ms':>8} {'errors':>6}")
+        for name, samples in self.latencies.items():
+            print(f"{name:<10} {len(samples):>7} {len(samples) / elapsed:>8.0f} "
+                  f"{percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 95) * 1000:>8.2f} "
+                  f"{percentile(samples, 99) * 1000:>8.2f} {max(samples) * 1000:>8.2f} "
+                  f"{self.errors.get(name, 0):>6}")
+
+
+async def phase(label: str, calls: list[tuple], concurrency: int):
+    recorder = Recorder()
+    limit = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(recorder.run(name, call, limit) for name, call in calls))
+    elapsed = time.perf_counter() - started
+
+    print(f"\n== {label}: {len(calls)} operations in {elapsed:.2f}s ({len(calls) / elapsed:.0f}/s)")
+    recorder.report(elapsed)
+    return recorder
+
+
+async def run(args, main, guild_schemas: list[str]):
+    from scripts.fakes import FakeGuild, FakeInteraction
+
+    await main.db.init()
+    main.jobs.start()
+
+    # The first guild is the home guild and shares main.db; the rest get
+    # their own files under GUILD_DATA_DIR
+    guilds = [FakeGuild(main.config.guild_id)] + [FakeGuild() for _ in range(args.guilds - 1)]
+    guild_schemas += [f"guild_{guild.id}" for guild in guilds[1:]]
+    services = {}
+    for guild in guilds:
+        services[guild.id] = await main.guilds.get(guild.id)
+        for name, cost, description in ITEMS:
+            await services[guild.id].db.upsert_item(name, cost, description)
+    item_ids = [row[0] for row in await main.db.get_store_items()]
+
+    admins = {guild.id: guild.add_member("admin") for guild in guilds}
+    members = [guilds[n % len(guilds)].add_member(f"player{n}") for n in range(args.users)]
+    # Referrers must share a guild with who they refer
+    founders, referred = members[:args.users // 2], members[args.users // 2:]
+
+    await phase("register", [
+        ("register", main.register.callback(FakeInteraction(member), member.name))
+        for member in founders
+    ], args.concurrency)
+
+    await phase("referral", [
+        ("referral", main.referral.callback(FakeInteraction(member), member.name,
+                                            random.choice([f for f in founders if f.guild is member.guild])))
+        for member in referred
+    ], args.concurrency)
+
+    for guild in guilds:
+        await services[guild.id].db.bulk_give([(str(member.id), 200) for member in members
+                                                if member.guild is guild])
+
+    interactions = []
+
+    async def operation(kind: str):
+        # The interaction is created once the operation gets a concurrency
+        # slot, as if Discord had just delivered it
+        member = random.choice(members)
+        interaction = FakeInteraction(admins[member.guild.id] if kind == "give" else member)
+        interactions.append(interaction)
+        if kind == "points":
+            await main.points.callback(interaction)
+        elif kind == "store":
+            await main.store.callback(interaction)
+        elif kind == "buy":
+            await services[member.guild.id].catalog.buy(interaction, random.choice(item_ids))
+        else:
+            await main.give_balance.callback(interaction, member, random.randint(1, 50))
+
+    kinds = random.choices([kind for kind, _ in MIX], weights=[weight for _, weight in MIX], k=args.operations)
+    await phase("mixed", [(kind, operation(kind)) for kind in kinds], args.concurrency)
+
+    acks = [interaction.responded_at - interaction.created_at for interaction in interactions]
+    print(f"\nacknowledged: p50 {percentile(acks, 50) * 1000:.2f} ms, p99 {percentile(acks, 99) * 1000:.2f} ms, "
+          f"max {max(acks) * 1000:.2f} ms")
+    print(f"command queue: {main.jobs.stats}")
+
+    print("\n== storage helpers (busiest first)")
+    print("\n".join(main.metrics.summary(main.metrics.queries)))
+    print(f"home pool: {main.db.pool_stats()}")
+
+    drift = []
+    for guild in guilds:
+        drift += await services[guild.id].db.reconcile_balances()
+    await main.jobs.stop()
+    await main.guilds.close()
+    await main.db.close()
+    print(f"balance drift after run: {len(drift)} users")
+    return 1 if drift else 0
+
+
+def with_search_path(dsn: str, schema: str) -> str:
+    # asyncpg passes unknown URL parameters on as server settings, so this
+    # puts the home database's tables in schema without touching main.py
+    parts = urlsplit(dsn)
+    query = parse_qsl(parts.query) + [("search_path", schema)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def create_schema(dsn: str, schema: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f'CREATE SCHEMA "{schema}"')
+    finally:
+        await conn.close()
+
+
+async def drop_schemas(dsn: str, schemas: list[str]):
+    import asyncpg
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        for schema in schemas:
+            await conn.execute(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE')
+    finally:
+        await conn.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--operations", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200, help="interactions in flight at once")
+    parser.add_argument("--guilds", type=int, default=1, help="guilds the members are spread over")
+    parser.add_argument("--postgres", help="PostgreSQL URL to run against, in a throwaway schema")
+    args = parser.parse_args()
+
+    schema = f"load_test_{uuid.uuid4().hex[:12]}" if args.postgres else None
+    with tempfile.TemporaryDirectory() as tmp:
+        # main reads its configuration at import time. DATABASE_URL is set
+        # rather than removed: load_dotenv only fills in variables that are
+        # missing, and would bring back the one in .env.
+        os.environ["DB_PATH"] = os.path.join(tmp, "load.db")
+        os.environ["GUILD_DATA_DIR"] = os.path.join(tmp, "guilds")
+        os.environ["DATABASE_URL"] = with_search_path(args.postgres, schema) if schema else ""
+        os.environ.setdefault("DISCORD_TOKEN", "offline")
+        os.environ.setdefault("GUILD_ID", "1")
+        if schema:
+            asyncio.run(create_schema(args.postgres, schema))
+        import main as bot
+
+        guild_schemas = []
+        try:
+            return asyncio.run(run(args, bot, guild_schemas))
+        finally:
+            if schema:
+                asyncio.run(drop_schemas(args.postgres, [schema] + guild_schemas))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
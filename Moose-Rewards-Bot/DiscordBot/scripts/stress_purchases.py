@@ -0,0 +1,136 @@
+# Hammers a shared temp database with concurrent purchases from many threads,
+# each on its own connection, then checks the ledger is still consistent:
+# no negative balances, no overspending and balances matching point_entries.
+#
+#   python -m scripts.stress_purchases --threads 8 --purchases 4000
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+
+ITEM_COSTS = [7, 13, 25, 40]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    for pragma in storage.PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def seed(path: str, users: int) -> dict[str, int]:
+    conn = connect(path)
+    storage.init_db(conn)
+    granted = {}
+
+    for cost in ITEM_COSTS:
+        storage.upsert_item(conn, f"Item {cost}", cost, "Stress item")
+    for n in range(users):
+        user_id = str(n)
+        storage.register_user(conn, user_id, f"player{n}")
+        granted[user_id] = 0
+        for _ in range(random.randint(1, 6)):
+            amount = random.randint(5, 60)
+            storage.give_points(conn, user_id, amount)
+            granted[user_id] += amount
+
+    conn.close()
+    return granted
+
+
+def worker(path: str, users: int, purchases: int, item_ids: list[int], results: dict, lock: threading.Lock):
+    conn = connect(path)
+    counts = {"bought": 0, "insufficient": 0, "no_item": 0}
+
+    for _ in range(purchases):
+        # Few users and many threads, so the same balance is fought over
+        user_id = str(random.randrange(users))
+        status, _ = storage.purchase(conn, user_id, random.choice(item_ids))
+        counts[status] += 1
+
+    conn.close()
+    with lock:
+        for status, count in counts.items():
+            results[status] = results.get(status, 0) + count
+
+
+def check(path: str, granted: dict[str, int]) -> list[str]:
+    conn = connect(path)
+    problems = []
+
+    spent = dict(conn.execute("""
+        SELECT i.discord_id, SUM(s.cost)
+        FROM user_inventory i
+        JOIN store_items s ON s.id = i.item_id
+        GROUP BY i.discord_id
+    """).fetchall())
+    ledger = dict(conn.execute("SELECT discord_id, SUM(points) FROM point_entries GROUP BY discord_id").fetchall())
+    balances = dict(conn.execute("SELECT discord_id, points FROM balances").fetchall())
+
+    for user_id, total in granted.items():
+        remaining = ledger.get(user_id, 0)
+        if remaining < 0 or balances.get(user_id, 0) < 0:
+            problems.append(f"user {user_id} has a negative balance ({remaining})")
+        if spent.get(user_id, 0) + remaining != total:
+            problems.append(f"user {user_id} granted {total} but spent {spent.get(user_id, 0)} with {remaining} left")
+        if balances.get(user_id, 0) != remaining:
+            problems.append(f"user {user_id} balance {balances.get(user_id, 0)} != ledger {remaining}")
+
+    bad_rows = conn.execute("SELECT COUNT(*) FROM point_entries WHERE points <= 0").fetchone()[0]
+    if bad_rows:
+        problems.append(f"{bad_rows} point_entries rows with zero or negative points")
+
+    conn.close()
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--purchases", type=int, default=4000, help="total purchases across all threads")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        granted = seed(path, args.users)
+
+        conn = connect(path)
+        item_ids = [row[0] for row in storage.get_store_items(conn)]
+        conn.close()
+
+        results = {}
+        lock = threading.Lock()
+        per_thread = args.purchases // args.threads
+        threads = [
+            threading.Thread(target=worker, args=(path, args.users, per_thread, item_ids, results, lock))
+            for _ in range(args.threads)
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        print(f"{sum(results.values())} purchases on {args.threads} threads in {elapsed:.2f}s "
+              f"({sum(results.values()) / elapsed:.0f}/s): {results}")
+
+        problems = check(path, granted)
+
+    for problem in problems[:20]:
+        print(f"FAIL {problem}")
+    print("ledger consistent" if not problems else f"{len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
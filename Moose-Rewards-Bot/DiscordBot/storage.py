@@ -0,0 +1,908 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import backups
+import export
+import migrations
+from metrics import Metrics
+from repository import Repository
+
+DB_PATH = "points.db"
+POINT_LIFETIME = timedelta(days=180)
+READ_WORKERS = 4
+SWEEP_CHUNK_SIZE = 1000
+BULK_CHUNK_SIZE = 500  # IDs per IN (...) lookup, well under SQLite's variable limit
+COMPACT_CHUNK_SIZE = 2000
+LEADERBOARD_TTL = 60  # Seconds a top-N result is served from memory
+INVENTORY_PAGE_SIZE = 10
+
+# A user's grants whose expiry falls in the same bucket share one row, so an
+# active member has a row per day instead of one per /give and spends touch
+# a handful of rows. A merged row expires with its earliest grant: later
+# grants lose at most one bucket of their POINT_LIFETIME. None stores every
+# grant as its own row.
+GRANT_BUCKET = "day"
+BUCKET_WIDTHS = {"day": len("2025-01-31"), "hour": len("2025-01-31 23")}
+
+# Applied to every pooled connection. WAL lets the readers run while the
+# writer commits, and NORMAL is safe under WAL (a crash can lose the last
+# commit, never corrupt the file).
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 MB page cache per connection
+    "PRAGMA mmap_size = 67108864",  # 64 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    # Long-lived connections shared between the storage threads. Connections
+    # run in autocommit mode; writes open their own transaction (see
+    # transaction() below) so they take the write lock up front.
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self.opened < self.size
+                if can_open:
+                    self.opened += 1
+            conn = self._open() if can_open else self._idle.get()
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.opened,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "avg_wait_ms": round(self.wait_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self.opened -= 1
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    # BEGIN IMMEDIATE takes the write lock before the first read, so checks
+    # made inside the block still hold when it commits
+    if conn.in_transaction:
+        yield
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+# Plain SQL helpers. Each one takes an open connection so they can be run
+# from the storage thread, a script or a benchmark without the bot.
+
+def init_db(conn: sqlite3.Connection) -> list[int]:
+    applied = migrations.migrate(conn)
+    if applied:
+        print(f"[Storage] Applied schema migrations {applied}")
+    return applied
+
+def remove_expired_chunk(conn: sqlite3.Connection, limit: int = SWEEP_CHUNK_SIZE) -> int:
+    # Deletes at most limit expired entries in one short transaction and
+    # returns how many went. Balances are only adjusted here; reads already
+    # ignore expired rows, so sweeping is housekeeping, not correctness.
+    cur = conn.cursor()
+
+    with transaction(conn):
+        cur.execute("""
+            DELETE FROM point_entries
+            WHERE id IN (
+                SELECT id FROM point_entries
+                WHERE expires_at <= ?
+                LIMIT ?
+            )
+            RETURNING discord_id, points
+        """, (datetime.now(), limit))
+
+        expired = {}
+        deleted = 0
+        for discord_id, points in cur.fetchall():
+            expired[discord_id] = expired.get(discord_id, 0) + points
+            deleted += 1
+
+        for discord_id, points in expired.items():
+            _adjust_balance(cur, discord_id, -points)
+
+    return deleted
+
+def _bucket_key(expires_at) -> str | None:
+    # Prefix of the stored timestamp; datetimes are stored as str(datetime)
+    return str(expires_at)[:BUCKET_WIDTHS[GRANT_BUCKET]] if GRANT_BUCKET else None
+
+# Rows without a bucket never conflict, so with GRANT_BUCKET = None this is a
+# plain insert
+GRANT_SQL = """
+    INSERT INTO point_entries (discord_id, points, earned_at, expires_at, bucket)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (discord_id, bucket) WHERE bucket IS NOT NULL DO UPDATE SET
+        points = points + excluded.points,
+        earned_at = MIN(earned_at, excluded.earned_at),
+        expires_at = MIN(expires_at, excluded.expires_at)
+"""
+
+def compact_entries_chunk(conn: sqlite3.Connection, limit: int = COMPACT_CHUNK_SIZE) -> tuple[int, int]:
+    # Folds at most limit unbucketed rows into bucket rows in one short
+    # transaction. Returns (rows removed, bucket rows written); (0, 0) once
+    # there is nothing left. A user's rows may be split across chunks; the
+    # upsert merges each part into the same bucket row. Totals and earliest
+    # expiries are unchanged, so balances need no adjustment.
+    if not GRANT_BUCKET:
+        return 0, 0
+
+    cur = conn.cursor()
+
+    with transaction(conn):
+        # The partial index lists unbucketed rows grouped by user
+        cur.execute("""
+            DELETE FROM point_entries
+            WHERE id IN (
+                SELECT id FROM point_entries
+                WHERE bucket IS NULL
+                LIMIT ?
+            )
+            RETURNING discord_id, points, earned_at, expires_at
+        """, (limit,))
+        rows = cur.fetchall()
+        if not rows:
+            return 0, 0
+
+        merged = {}
+        for discord_id, points, earned_at, expires_at in rows:
+            key = (discord_id, _bucket_key(expires_at))
+            if key in merged:
+                total, first_earned, first_expiry = merged[key]
+                merged[key] = (total + points, min(first_earned, earned_at), min(first_expiry, expires_at))
+            else:
+                merged[key] = (points, earned_at, expires_at)
+
+        cur.executemany(GRANT_SQL, [
+            (discord_id, points, earned_at, expires_at, bucket)
+            for (discord_id, bucket), (points, earned_at, expires_at) in merged.items()
+        ])
+
+    return len(rows), len(merged)
+
+ADJUST_BALANCE_SQL = """
+    INSERT INTO balances (discord_id, points, next_expiry)
+    VALUES (?, ?, (SELECT MIN(expires_at) FROM point_entries WHERE discord_id = ?))
+    ON CONFLICT(discord_id) DO UPDATE SET
+        points = points + excluded.points,
+        next_expiry = excluded.next_expiry
+"""
+
+def _adjust_balance(cur: sqlite3.Cursor, discord_id: str, delta: int):
+    # Call after changing the user's point_entries, inside the same transaction
+    cur.execute(ADJUST_BALANCE_SQL, (discord_id, delta, discord_id))
+
+RECORD_EARNED_SQL = """
+    INSERT INTO user_stats (discord_id, earned) VALUES (?, ?)
+    ON CONFLICT(discord_id) DO UPDATE SET earned = earned + excluded.earned
+"""
+
+def _record_purchase(cur: sqlite3.Cursor, discord_id: str, item_id: int, cost: int):
+    # Lifetime stats for /topspenders and /storestats, in the purchase's transaction
+    cur.execute("""
+        INSERT INTO user_stats (discord_id, spent) VALUES (?, ?)
+        ON CONFLICT(discord_id) DO UPDATE SET spent = spent + excluded.spent
+    """, (discord_id, cost))
+    cur.execute("""
+        INSERT INTO item_sales (item_id, purchases, points) VALUES (?, 1, ?)
+        ON CONFLICT(item_id) DO UPDATE SET
+            purchases = purchases + 1,
+            points = points + excluded.points
+    """, (item_id, cost))
+
+def _rebuild_balances(cur: sqlite3.Cursor):
+    cur.execute("DELETE FROM balances")
+    cur.execute("""
+        INSERT INTO balances (discord_id, points, next_expiry)
+        SELECT discord_id, SUM(points), MIN(expires_at)
+        FROM point_entries
+        GROUP BY discord_id
+    """)
+
+def reconcile_balances(conn: sqlite3.Connection) -> list[tuple]:
+    # Rebuilds balances from point_entries and returns every user whose stored
+    # total was wrong as (discord_id, stored, actual)
+    cur = conn.cursor()
+
+    with transaction(conn):
+        cur.execute("""
+            WITH actual AS (
+                SELECT discord_id, SUM(points) AS points
+                FROM point_entries
+                GROUP BY discord_id
+            )
+            SELECT b.discord_id, b.points, COALESCE(a.points, 0)
+            FROM balances b
+            LEFT JOIN actual a ON a.discord_id = b.discord_id
+            WHERE b.points != COALESCE(a.points, 0)
+            UNION ALL
+            SELECT a.discord_id, 0, a.points
+            FROM actual a
+            WHERE a.discord_id NOT IN (SELECT discord_id FROM balances)
+        """)
+        drift = cur.fetchall()
+        _rebuild_balances(cur)
+
+    return drift
+
+def set_setting(conn: sqlite3.Connection, key: str, value: str):
+    with transaction(conn):
+        conn.execute("""
+            INSERT INTO settings (key, value)
+            VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (key, value))
+
+def get_setting(conn: sqlite3.Connection, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def get_settings(conn: sqlite3.Connection) -> dict[str, str]:
+    return dict(conn.execute("SELECT key, value FROM settings").fetchall())
+
+def is_registered(conn: sqlite3.Connection, discord_id: str) -> bool:
+    row = conn.execute("SELECT 1 FROM users WHERE discord_id = ?", (discord_id,)).fetchone()
+    return row is not None
+
+def register_user(conn: sqlite3.Connection, discord_id: str, username: str) -> bool:
+    with transaction(conn):
+        if is_registered(conn, discord_id):
+            return False
+
+        conn.execute("INSERT INTO users (discord_id, username) VALUES (?, ?)", (discord_id, username))
+    return True
+
+def register_referral(conn: sqlite3.Connection, discord_id: str, username: str, referral_id: str, amount: int) -> str:
+    cur = conn.cursor()
+
+    with transaction(conn):
+        # Check if user is already registered
+        if is_registered(conn, discord_id):
+            return "already_registered"
+
+        # Check if referral exists
+        cur.execute("SELECT referrals FROM users WHERE discord_id = ?", (referral_id,))
+        row = cur.fetchone()
+        if not row:
+            return "referrer_missing"
+        if row[0] == 0:
+            return "no_referrals"
+
+        # Register new user and reward referrer in one commit
+        cur.execute("INSERT INTO users (discord_id, username) VALUES (?, ?)", (discord_id, username))
+        _grant_points(cur, referral_id, amount)
+        cur.execute("UPDATE users SET referrals = referrals - 1 WHERE discord_id = ?", (referral_id,))
+    return "registered"
+
+def _grant_points(cur: sqlite3.Cursor, discord_id: str, amount: int):
+    now = datetime.now()
+    expires_at = now + POINT_LIFETIME
+    cur.execute(GRANT_SQL, (discord_id, amount, now, expires_at, _bucket_key(expires_at)))
+    _adjust_balance(cur, discord_id, amount)
+    cur.execute(RECORD_EARNED_SQL, (discord_id, amount))
+
+def give_points(conn: sqlite3.Connection, discord_id: str, amount: int) -> bool:
+    with transaction(conn):
+        if not is_registered(conn, discord_id):
+            return False
+
+        _grant_points(conn.cursor(), discord_id, amount)
+    return True
+
+def registered_ids(conn: sqlite3.Connection, discord_ids: list[str]) -> set[str]:
+    found = set()
+    for start in range(0, len(discord_ids), BULK_CHUNK_SIZE):
+        chunk = discord_ids[start:start + BULK_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT discord_id FROM users WHERE discord_id IN ({placeholders})", chunk)
+        found.update(discord_id for (discord_id,) in rows)
+    return found
+
+def bulk_give(conn: sqlite3.Connection, grants: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+    # Grants (discord_id, amount) pairs in one transaction. Returns the grants
+    # applied and the IDs skipped because they are not registered.
+    now = datetime.now()
+    expires_at = now + POINT_LIFETIME
+    bucket = _bucket_key(expires_at)
+    cur = conn.cursor()
+
+    with transaction(conn):
+        registered = registered_ids(conn, list({discord_id for discord_id, _ in grants}))
+        applied = [(discord_id, amount) for discord_id, amount in grants if discord_id in registered and amount > 0]
+
+        cur.executemany(GRANT_SQL, [(discord_id, amount, now, expires_at, bucket) for discord_id, amount in applied])
+        cur.executemany(ADJUST_BALANCE_SQL, [(discord_id, amount, discord_id) for discord_id, amount in applied])
+        cur.executemany(RECORD_EARNED_SQL, applied)
+
+    skipped = sorted({discord_id for discord_id, _ in grants} - registered)
+    return applied, skipped
+
+def bulk_remove(conn: sqlite3.Connection, removals: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+    # Like /remove for many members in one transaction: each loses up to the
+    # amount asked. Returns (discord_id, points actually removed) pairs and the
+    # unregistered IDs.
+    cur = conn.cursor()
+
+    with transaction(conn):
+        registered = registered_ids(conn, list({discord_id for discord_id, _ in removals}))
+        applied = [
+            (discord_id, _consume_points(cur, discord_id, amount, partial=True))
+            for discord_id, amount in removals
+            if discord_id in registered and amount > 0
+        ]
+
+    skipped = sorted({discord_id for discord_id, _ in removals} - registered)
+    return applied, skipped
+
+def total_points(conn: sqlite3.Connection, discord_id: str) -> int:
+    now = datetime.now()
+    row = conn.execute("""
+        SELECT points, next_expiry IS NULL OR next_expiry > ?
+        FROM balances
+        WHERE discord_id = ?
+    """, (now, discord_id)).fetchone()
+
+    if row is None:
+        return 0
+    if row[1]:
+        return row[0]
+
+    # Some of the user's points have expired but not been swept yet
+    row = conn.execute("""
+        SELECT COALESCE(SUM(points), 0)
+        FROM point_entries
+        WHERE discord_id = ?
+        AND expires_at > ?
+    """, (discord_id, now)).fetchone()
+    return row[0]
+
+def _consume_points(cur: sqlite3.Cursor, discord_id: str, amount: int, partial: bool = False) -> int:
+    # Spends unexpired entries oldest first and returns how many points were
+    # taken. Unless partial is set it takes all of amount or nothing. Must run
+    # inside a write transaction.
+    now = datetime.now()
+
+    # The first entry whose running total covers amount; everything before it
+    # is used up and it keeps the leftover
+    cur.execute("""
+        WITH fifo AS (
+            SELECT id, earned_at, SUM(points) OVER (ORDER BY earned_at, id) AS running
+            FROM point_entries
+            WHERE discord_id = ? AND expires_at > ?
+        )
+        SELECT id, earned_at, running
+        FROM fifo
+        WHERE running >= ?
+        ORDER BY earned_at, id
+        LIMIT 1
+    """, (discord_id, now, amount))
+    boundary = cur.fetchone()
+
+    if boundary is None:
+        if not partial:
+            return 0
+        cur.execute("""
+            DELETE FROM point_entries
+            WHERE discord_id = ? AND expires_at > ?
+            RETURNING points
+        """, (discord_id, now))
+        consumed = sum(points for (points,) in cur.fetchall())
+    else:
+        entry_id, earned_at, running = boundary
+        cur.execute("""
+            DELETE FROM point_entries
+            WHERE discord_id = ? AND expires_at > ?
+            AND (earned_at, id) < (?, ?)
+        """, (discord_id, now, earned_at, entry_id))
+        if running > amount:
+            cur.execute("UPDATE point_entries SET points = ? WHERE id = ?", (running - amount, entry_id))
+        else:
+            cur.execute("DELETE FROM point_entries WHERE id = ?", (entry_id,))
+        consumed = amount
+
+    if consumed:
+        _adjust_balance(cur, discord_id, -consumed)
+    return consumed
+
+def spend_points(conn: sqlite3.Connection, discord_id: str, amount: int) -> bool:
+    with transaction(conn):
+        return _consume_points(conn.cursor(), discord_id, amount) == amount
+
+def remove_points(conn: sqlite3.Connection, discord_id: str, amount: int) -> bool:
+    # Admin removal takes whatever the user has, up to amount
+    with transaction(conn):
+        if not is_registered(conn, discord_id):
+            return False
+
+        _consume_points(conn.cursor(), discord_id, amount, partial=True)
+    return True
+
+def purchase(conn: sqlite3.Connection, discord_id: str, item_id: int) -> tuple[str, tuple | None]:
+    # Price check, spend and inventory insert commit together, so two clicks
+    # racing each other can never both pass the balance check.
+    # Returns (status, (name, cost)).
+    cur = conn.cursor()
+
+    with transaction(conn):
+        cur.execute("SELECT name, cost FROM store_items WHERE id = ?", (item_id,))
+        item = cur.fetchone()
+        if not item:
+            return "no_item", None
+
+        if _consume_points(cur, discord_id, item[1]) != item[1]:
+            return "insufficient", item
+
+        cur.execute("""
+            INSERT INTO user_inventory (discord_id, item_id)
+            VALUES (?, ?)
+        """, (discord_id, item_id))
+        _record_purchase(cur, discord_id, item_id, item[1])
+    return "bought", item
+
+def top_earners(conn: sqlite3.Connection, limit: int) -> list[tuple]:
+    return conn.execute("""
+        SELECT discord_id, earned FROM user_stats
+        WHERE earned > 0
+        ORDER BY earned DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+def top_spenders(conn: sqlite3.Connection, limit: int) -> list[tuple]:
+    return conn.execute("""
+        SELECT discord_id, spent FROM user_stats
+        WHERE spent > 0
+        ORDER BY spent DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+def top_items(conn: sqlite3.Connection, limit: int) -> list[tuple]:
+    # (name, purchases, points); items removed from the store keep their sales
+    return conn.execute("""
+        SELECT COALESCE(i.name, 'Removed item #' || s.item_id), s.purchases, s.points
+        FROM item_sales s
+        LEFT JOIN store_items i ON i.id = s.item_id
+        WHERE s.purchases > 0
+        ORDER BY s.purchases DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+def get_store_items(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute("SELECT id, name, cost, description FROM store_items").fetchall()
+
+def upsert_item(conn: sqlite3.Connection, name: str, cost: int, description: str) -> bool:
+    cur = conn.cursor()
+
+    with transaction(conn):
+        # Check if item already exists (by name)
+        cur.execute("SELECT id FROM store_items WHERE name = ?", (name,))
+        row = cur.fetchone()
+
+        if row:
+            cur.execute("UPDATE store_items SET cost = ?, description = ? WHERE id = ?", (cost, description, row[0]))
+        else:
+            cur.execute("INSERT INTO store_items (name, cost, description) VALUES (?, ?, ?)", (name, cost, description))
+
+    return row is not None  # True if an existing item was updated
+
+def delete_item(conn: sqlite3.Connection, name: str) -> bool:
+    cur = conn.cursor()
+    with transaction(conn):
+        cur.execute("DELETE FROM store_items WHERE name = ?", (name,))
+    return cur.rowcount > 0
+
+def get_inventory_page(conn: sqlite3.Connection, discord_id: str, cursor: tuple | None = None,
+                       newer: bool = False, limit: int = INVENTORY_PAGE_SIZE) -> list[tuple]:
+    # Up to limit purchases as (id, purchased_at, name, description), newest
+    # first. cursor is the (purchased_at, id) of a row already shown: the page
+    # holds the rows older than it, or the rows newer than it if newer is set.
+    # Keyset paging, so every page is one index range read however deep.
+    if cursor is None:
+        return conn.execute("""
+            SELECT i.id, i.purchased_at, s.name, s.description
+            FROM user_inventory i
+            JOIN store_items s ON i.item_id = s.id
+            WHERE i.discord_id = ?
+            ORDER BY i.purchased_at DESC, i.id DESC
+            LIMIT ?
+        """, (discord_id, limit)).fetchall()
+
+    if not newer:
+        return conn.execute("""
+            SELECT i.id, i.purchased_at, s.name, s.description
+            FROM user_inventory i
+            JOIN store_items s ON i.item_id = s.id
+            WHERE i.discord_id = ? AND (i.purchased_at, i.id) < (?, ?)
+            ORDER BY i.purchased_at DESC, i.id DESC
+            LIMIT ?
+        """, (discord_id, *cursor, limit)).fetchall()
+
+    rows = conn.execute("""
+        SELECT i.id, i.purchased_at, s.name, s.description
+        FROM user_inventory i
+        JOIN store_items s ON i.item_id = s.id
+        WHERE i.discord_id = ? AND (i.purchased_at, i.id) > (?, ?)
+        ORDER BY i.purchased_at ASC, i.id ASC
+        LIMIT ?
+    """, (discord_id, *cursor, limit)).fetchall()
+    rows.reverse()
+    return rows
+
+def get_inventory_summary(conn: sqlite3.Connection, discord_id: str) -> list[tuple]:
+    # (name, count, last purchased) per item, most owned first. Grouped in
+    # item_id order straight off idx_user_inventory_item; the few groups are
+    # sorted here rather than with a temp B-tree.
+    rows = conn.execute("""
+        SELECT s.name, COUNT(*), MAX(i.purchased_at)
+        FROM user_inventory i
+        JOIN store_items s ON i.item_id = s.id
+        WHERE i.discord_id = ?
+        GROUP BY i.item_id
+    """, (discord_id,)).fetchall()
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows
+
+def remove_user_item(conn: sqlite3.Connection, discord_id: str, item_name: str) -> str:
+    cur = conn.cursor()
+
+    with transaction(conn):
+        # Find the item ID from the store by name
+        cur.execute("SELECT id FROM store_items WHERE name = ?", (item_name,))
+        item = cur.fetchone()
+        if not item:
+            return "no_item"
+
+        # Get the oldest (FIFO) inventory entry for this item and user
+        cur.execute("""
+            SELECT id
+            FROM user_inventory
+            WHERE discord_id = ?
+              AND item_id = ?
+            ORDER BY purchased_at ASC
+            LIMIT 1
+        """, (discord_id, item[0]))
+        inventory_entry = cur.fetchone()
+        if not inventory_entry:
+            return "not_owned"
+
+        cur.execute("DELETE FROM user_inventory WHERE id = ?", (inventory_entry[0],))
+    return "removed"
+
+def get_open_tickets(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute("SELECT channel_id, discord_id FROM tickets WHERE status = 'open'").fetchall()
+
+def open_ticket(conn: sqlite3.Connection, discord_id: str, channel_id: str) -> bool:
+    # False if the member already has an open ticket
+    cur = conn.cursor()
+    with transaction(conn):
+        cur.execute("""
+            INSERT INTO tickets (channel_id, discord_id)
+            VALUES (?, ?)
+            ON CONFLICT DO NOTHING
+        """, (channel_id, discord_id))
+    return cur.rowcount > 0
+
+def close_ticket(conn: sqlite3.Connection, channel_id: str) -> bool:
+    cur = conn.cursor()
+    with transaction(conn):
+        cur.execute("""
+            UPDATE tickets SET status = 'closed', closed_at = ?
+            WHERE channel_id = ? AND status = 'open'
+        """, (datetime.now(), channel_id))
+    return cur.rowcount > 0
+
+def add_audit_event(conn: sqlite3.Connection, kind: str, message: str, actor_id: str | None,
+                    target_id: str | None, amount: int | None) -> int:
+    cur = conn.cursor()
+    with transaction(conn):
+        cur.execute("""
+            INSERT INTO audit_log (created_at, kind, actor_id, target_id, amount, message)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (datetime.now(), kind, actor_id, target_id, amount, message))
+    return cur.lastrowid
+
+def get_undelivered_audit(conn: sqlite3.Connection, before_id: int, limit: int) -> list[tuple]:
+    return conn.execute("""
+        SELECT id, message FROM audit_log
+        WHERE delivered_at IS NULL AND id < ?
+        ORDER BY id
+        LIMIT ?
+    """, (before_id, limit)).fetchall()
+
+def next_audit_id(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM audit_log").fetchone()[0]
+
+def mark_audit_delivered(conn: sqlite3.Connection, event_ids: list[int]):
+    now = datetime.now()
+    with transaction(conn):
+        conn.executemany("UPDATE audit_log SET delivered_at = ? WHERE id = ?",
+                         [(now, event_id) for event_id in event_ids])
+
+
+class Storage(Repository):
+    # Async front for the helpers above. Writes are handed to one dedicated
+    # thread so they queue instead of fighting over the SQLite write lock;
+    # reads run on a small thread pool. Both borrow long-lived connections from
+    # the pool, so command handlers only ever await and a slow write or fsync
+    # never blocks the gateway heartbeat.
+
+    def __init__(self, path: str = DB_PATH, read_workers: int = READ_WORKERS, metrics: Metrics | None = None):
+        self.path = path
+        self.metrics = metrics or Metrics()
+        self.pool = ConnectionPool(path, size=read_workers + 1)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="storage-reader")
+        self.last_sweep = None
+        self.last_compaction = None
+        self.last_backup = None
+        self._top = {}
+        self._settings = {}
+
+    def _call(self, fn, args):
+        # Timed on the storage thread, so the latency is the helper itself
+        # and not the wait for a free worker
+        with self.pool.connection() as conn:
+            changes = conn.total_changes
+            started = time.perf_counter()
+            failed = True
+            result = None
+            try:
+                result = fn(conn, *args)
+                failed = False
+                return result
+            finally:
+                rows = conn.total_changes - changes
+                if isinstance(result, list):
+                    rows += len(result)
+                self.metrics.observe_query(fn.__name__, time.perf_counter() - started, rows, failed, args)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._call, fn, args)
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._call, fn, args)
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    async def init(self) -> list[int]:
+        applied = await self._run(init_db)
+        await self.load_settings()
+        return applied
+
+    async def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.pool.close()
+
+    async def sweep_expired(self, chunk_size: int = SWEEP_CHUNK_SIZE) -> dict:
+        # Each chunk is its own job on the writer thread, so commands queued
+        # behind the sweep wait for one small chunk at most, never the whole run
+        started = time.perf_counter()
+        rows = chunks = 0
+
+        while True:
+            deleted = await self._run(remove_expired_chunk, chunk_size)
+            rows += deleted
+            chunks += 1
+            if deleted < chunk_size:
+                break
+            await asyncio.sleep(0)
+
+        self.last_sweep = {
+            "rows": rows,
+            "chunks": chunks,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(),
+        }
+        return self.last_sweep
+
+    async def compact_entries(self, chunk_size: int = COMPACT_CHUNK_SIZE) -> dict:
+        # Folds pre-bucket grants into bucket rows a few users at a time, the
+        # same way sweep_expired paces itself. A no-op index probe once done.
+        started = time.perf_counter()
+        removed = written = chunks = 0
+
+        while True:
+            rows, buckets = await self._run(compact_entries_chunk, chunk_size)
+            if not rows:
+                break
+            removed += rows
+            written += buckets
+            chunks += 1
+            await asyncio.sleep(0)
+
+        self.last_compaction = {
+            "rows": removed,
+            "buckets": written,
+            "chunks": chunks,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(),
+        }
+        return self.last_compaction
+
+    async def reconcile_balances(self) -> list[tuple]:
+        return await self._run(reconcile_balances)
+
+    async def backup(self, directory: str = backups.BACKUP_DIR, keep: int = backups.BACKUP_KEEP) -> dict:
+        # On its own thread and connection rather than the writer's, so
+        # commands never queue behind it
+        self.last_backup = await asyncio.to_thread(backups.snapshot, self.path, directory, keep)
+        return self.last_backup
+
+    async def export(self, path: str, table: str, fmt: str, discord_id: str | None = None,
+                     since: datetime | None = None, until: datetime | None = None) -> dict:
+        # Also on its own thread and connection, for the same reason
+        return await asyncio.to_thread(export.export_sqlite, self.path, path, table, fmt, discord_id, since, until)
+
+    # Settings are read on hot paths (every reaction in the guild), so they
+    # are served from memory. set_setting writes through; call
+    # invalidate_settings() after changing the table behind the bot's back.
+
+    async def load_settings(self):
+        self._settings = await self._read(get_settings)
+
+    async def invalidate_settings(self):
+        self._settings = {}
+        await self.load_settings()
+
+    async def set_setting(self, key: str, value: str):
+        await self._run(set_setting, key, value)
+        self._settings[key] = value
+
+    def get_setting(self, key: str) -> str | None:
+        self.metrics.increment("settings_cache_reads")
+        return self._settings.get(key)
+
+    async def is_registered(self, discord_id: str) -> bool:
+        return await self._read(is_registered, discord_id)
+
+    async def register_user(self, discord_id: str, username: str) -> bool:
+        return await self._run(register_user, discord_id, username)
+
+    async def register_referral(self, discord_id: str, username: str, referral_id: str, amount: int) -> str:
+        return await self._run(register_referral, discord_id, username, referral_id, amount)
+
+    async def give_points(self, discord_id: str, amount: int) -> bool:
+        return await self._run(give_points, discord_id, amount)
+
+    async def bulk_give(self, grants: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        return await self._run(bulk_give, grants)
+
+    async def bulk_remove(self, removals: list[tuple[str, int]]) -> tuple[list[tuple], list[str]]:
+        return await self._run(bulk_remove, removals)
+
+    async def total_points(self, discord_id: str) -> int:
+        return await self._read(total_points, discord_id)
+
+    async def spend_points(self, discord_id: str, amount: int) -> bool:
+        return await self._run(spend_points, discord_id, amount)
+
+    async def remove_points(self, discord_id: str, amount: int) -> bool:
+        return await self._run(remove_points, discord_id, amount)
+
+    async def purchase(self, discord_id: str, item_id: int) -> tuple[str, tuple | None]:
+        return await self._run(purchase, discord_id, item_id)
+
+    # Leaderboards change with every grant, but nobody needs them to the
+    # second; each (query, limit) is served from memory for LEADERBOARD_TTL
+
+    async def _cached_top(self, fn, limit: int) -> list[tuple]:
+        key = (fn.__name__, limit)
+        cached = self._top.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        result = await self._read(fn, limit)
+        self._top[key] = (time.monotonic() + LEADERBOARD_TTL, result)
+        return result
+
+    async def top_earners(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_earners, limit)
+
+    async def top_spenders(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_spenders, limit)
+
+    async def top_items(self, limit: int = 10) -> list[tuple]:
+        return await self._cached_top(top_items, limit)
+
+    async def get_store_items(self) -> list[tuple]:
+        return await self._read(get_store_items)
+
+    async def upsert_item(self, name: str, cost: int, description: str) -> bool:
+        return await self._run(upsert_item, name, cost, description)
+
+    async def delete_item(self, name: str) -> bool:
+        return await self._run(delete_item, name)
+
+    async def get_inventory_page(self, discord_id: str, cursor: tuple | None = None, newer: bool = False,
+                                 limit: int = INVENTORY_PAGE_SIZE) -> list[tuple]:
+        return await self._read(get_inventory_page, discord_id, cursor, newer, limit)
+
+    async def get_inventory_summary(self, discord_id: str) -> list[tuple]:
+        return await self._read(get_inventory_summary, discord_id)
+
+    async def remove_user_item(self, discord_id: str, item_name: str) -> str:
+        return await self._run(remove_user_item, discord_id, item_name)
+
+    async def get_open_tickets(self) -> list[tuple]:
+        return await self._read(get_open_tickets)
+
+    async def open_ticket(self, discord_id: str, channel_id: str) -> bool:
+        return await self._run(open_ticket, discord_id, channel_id)
+
+    async def close_ticket(self, channel_id: str) -> bool:
+        return await self._run(close_ticket, channel_id)
+
+    async def add_audit_event(self, kind: str, message: str, actor_id: str | None = None,
+                              target_id: str | None = None, amount: int | None = None) -> int:
+        return await self._run(add_audit_event, kind, message, actor_id, target_id, amount)
+
+    async def get_undelivered_audit(self, before_id: int, limit: int) -> list[tuple]:
+        return await self._read(get_undelivered_audit, before_id, limit)
+
+    async def next_audit_id(self) -> int:
+        return await self._read(next_audit_id)
+
+    async def mark_audit_delivered(self, event_ids: list[int]):
+        await self._run(mark_audit_delivered, event_ids)
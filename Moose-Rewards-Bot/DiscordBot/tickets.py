@@ -0,0 +1,184 @@
+import asyncio
+
+import discord
+
+from gateway import MemberCache
+from repository import Repository
+
+
+class TicketRegistry:
+    # In-memory index of open tickets backed by the tickets table. Everything
+    # is keyed by member and channel ID, so renaming a channel or a member
+    # never loses a ticket, and lookups are dictionary hits instead of scans
+    # over guild.text_channels.
+
+    def __init__(self, db: Repository):
+        self.db = db
+        self._by_member = {}
+        self._by_channel = {}
+        self._checked = set()  # Legacy channels already tried for adoption
+
+    def channel_for(self, member_id: int) -> int | None:
+        return self._by_member.get(member_id)
+
+    def owner_of(self, channel_id: int) -> int | None:
+        return self._by_channel.get(channel_id)
+
+    def _index(self, member_id: int, channel_id: int):
+        self._by_member[member_id] = channel_id
+        self._by_channel[channel_id] = member_id
+
+    def _unindex(self, channel_id: int):
+        member_id = self._by_channel.pop(channel_id, None)
+        if member_id is not None and self._by_member.get(member_id) == channel_id:
+            del self._by_member[member_id]
+
+    async def load(self, guild: discord.Guild, category_id: int | None = None, members: MemberCache | None = None):
+        # Rebuilds the index from the database. Tickets whose channel was
+        # deleted while the bot was offline are closed; ticket channels from
+        # before the registry existed are adopted using the member in their
+        # permission overwrites, looked up through members if discord.py
+        # hasn't cached them. load runs on every on_ready, so each channel is
+        # only tried once per process: in low-memory mode a lookup can be a
+        # REST call, and reconnects shouldn't repeat them.
+        self._by_member = {}
+        self._by_channel = {}
+
+        for channel_id, member_id in await self.db.get_open_tickets():
+            if guild.get_channel(int(channel_id)) is None:
+                await self.db.close_ticket(channel_id)
+                continue
+            self._index(int(member_id), int(channel_id))
+
+        category = guild.get_channel(category_id) if category_id else None
+        if not isinstance(category, discord.CategoryChannel):
+            return
+
+        for channel in category.text_channels:
+            if channel.id in self._by_channel or channel.id in self._checked or not channel.name.startswith("ticket-"):
+                continue
+            owner = None
+            for target in channel.overwrites:
+                # discord.py gives uncached members as Object(type=User)
+                if isinstance(target, discord.Object) and target.type is not discord.Role and members is not None:
+                    target = await members.resolve(guild, target.id)
+                if isinstance(target, discord.Member) and not target.bot:
+                    owner = target
+                    break
+            # Only once the lookups went through, so a failed one is retried
+            self._checked.add(channel.id)
+            if owner is not None and await self.open(owner.id, channel.id):
+                print(f"[Tickets] Adopted #{channel.name} for {owner}")
+
+    async def open(self, member_id: int, channel_id: int) -> bool:
+        if not await self.db.open_ticket(str(member_id), str(channel_id)):
+            return False
+        self._index(member_id, channel_id)
+        return True
+
+    async def close(self, channel_id: int):
+        self._unindex(channel_id)
+        await self.db.close_ticket(str(channel_id))
+
+
+class TicketQueue:
+    # Serializes ticket creation so a member mashing the reaction can't open
+    # several channels or burn through the global rate limit. Each member has
+    # a lock held until their request finishes; reactions arriving meanwhile
+    # are coalesced into it. A few workers drain a bounded queue, which paces
+    # the REST calls; when it is full producers wait up to QUEUE_WAIT seconds
+    # before the request is dropped.
+
+    WORKERS = 2
+    MAX_QUEUED = 50
+    QUEUE_WAIT = 10
+
+    def __init__(self, registry: TicketRegistry, category_id: int):
+        self.registry = registry
+        self.category_id = category_id
+        self._queue = asyncio.Queue(maxsize=self.MAX_QUEUED)
+        self._locks = {}
+        self._workers = []
+        self.stats = dict.fromkeys(
+            ("requested", "coalesced", "created", "already_open", "dropped", "failed"), 0)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.WORKERS)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, member: discord.Member):
+        self.stats["requested"] += 1
+        lock = self._locks.setdefault(member.id, asyncio.Lock())
+        if lock.locked():
+            self.stats["coalesced"] += 1
+            return
+
+        async with lock:
+            done = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._queue.put((member, done)), timeout=self.QUEUE_WAIT)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                print(f"[Tickets] Queue full, dropped ticket request from {member}")
+            else:
+                await done
+
+        if not lock.locked():
+            self._locks.pop(member.id, None)
+
+    async def _worker(self):
+        while True:
+            member, done = await self._queue.get()
+            try:
+                await self._create(member)
+            except Exception as e:
+                # discord.py waits out 429s itself, so this is an error Discord
+                # kept returning or something else going wrong
+                self.stats["failed"] += 1
+                print(f"[Tickets] Failed to create a ticket for {member}: {e}")
+            finally:
+                done.set_result(None)
+                self._queue.task_done()
+
+    async def _create(self, member: discord.Member):
+        # Check if the user already has an open ticket
+        if self.registry.channel_for(member.id):
+            self.stats["already_open"] += 1
+            return
+
+        guild = member.guild
+        category = guild.get_channel(self.category_id)
+        admin_role = discord.utils.get(guild.roles, name="Admin")
+
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            member: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True),
+        }
+        if admin_role:
+            overwrites[admin_role] = discord.PermissionOverwrite(view_channel=True, send_messages=True,
+                                                                 read_message_history=True)
+
+        channel = await guild.create_text_channel(
+            name=f"ticket-{member.name}",
+            category=category,
+            overwrites=overwrites,
+            reason="Support ticket"
+        )
+
+        # Another process got there first
+        if not await self.registry.open(member.id, channel.id):
+            self.stats["already_open"] += 1
+            await channel.delete(reason="Duplicate ticket")
+            return
+
+        self.stats["created"] += 1
+        await channel.send(f"{member.mention} your ticket has been created. A staff member will be with you shortly.")